@@ -0,0 +1,201 @@
+"""Proportional stick output: deflection -> pulse-width-modulated keys or pointer velocity.
+
+Reports only store the latest deflection. Output is produced by a fixed-rate
+scheduler on the runtime loop, so motion is paced by the monotonic clock and
+not by when BLE packets happen to arrive.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from input_mapper import move_mouse, update_stick_keys
+from stick_quantizer import DEFAULT_CALIBRATION, StickCalibration
+
+STICK_MODES = ("digital", "pwm", "pointer")
+DEFAULT_OUTPUT_HZ = 125.0
+# Full-deflection pointer speed in pixels per second
+DEFAULT_POINTER_SPEED = 1200.0
+# One on/off cycle of a PWM'd direction key; long enough for games that poll at 30-60 Hz
+DEFAULT_PWM_PERIOD = 0.1
+
+_LUT_SIZE = 256
+
+# A curve is a built-in name or the points of a custom LUT, evenly spaced over 0..1
+Curve = Union[str, Tuple[float, ...]]
+
+
+@lru_cache(maxsize=None)
+def curve_table(curve: Curve) -> Tuple[float, ...]:
+    """Response curve sampled at _LUT_SIZE + 1 points over deflection 0..1."""
+    if curve == "linear":
+        return tuple(i / _LUT_SIZE for i in range(_LUT_SIZE + 1))
+    if curve == "quadratic":
+        return tuple((i / _LUT_SIZE) ** 2 for i in range(_LUT_SIZE + 1))
+    if curve == "cubic":
+        return tuple((i / _LUT_SIZE) ** 3 for i in range(_LUT_SIZE + 1))
+    if isinstance(curve, tuple):
+        # Resample the user's points onto the table with linear interpolation
+        last = len(curve) - 1
+        table = []
+        for i in range(_LUT_SIZE + 1):
+            pos = i / _LUT_SIZE * last
+            lo = min(int(pos), last - 1)
+            table.append(curve[lo] + (curve[lo + 1] - curve[lo]) * (pos - lo))
+        return tuple(table)
+    raise ValueError(f"unknown stick curve {curve!r}")
+
+
+def parse_curve(raw: object) -> Curve:
+    """Validate a ``stick_curve`` setting: a curve name or a list of 2+ outputs in 0..1."""
+    if isinstance(raw, str):
+        curve_table(raw)
+        return raw
+    if isinstance(raw, list) and len(raw) >= 2 and all(isinstance(v, (int, float)) and 0 <= v <= 1 for v in raw):
+        return tuple(float(v) for v in raw)
+    raise ValueError(f"stick curve must be linear, quadratic, cubic or a list of values in 0..1, got {raw!r}")
+
+
+class AnalogStick:
+    """Latest deflection of one stick plus the output state driven from it."""
+
+    def __init__(self, mode: str = "pointer", curve: Curve = "quadratic",
+                 speed: float = DEFAULT_POINTER_SPEED, pwm_period: float = DEFAULT_PWM_PERIOD,
+                 stick_id: str = "left", calibration: StickCalibration = DEFAULT_CALIBRATION) -> None:
+        if mode not in ("pwm", "pointer"):
+            raise ValueError(f"analog stick mode must be pwm or pointer, got {mode!r}")
+        self.mode = mode
+        self.table = curve_table(curve)
+        self.calibration = calibration
+        self.speed = speed
+        self.pwm_period = pwm_period
+        self.stick_id = stick_id
+        # Normalized deflection, x right / y down, written on every report
+        self.x = 0.0
+        self.y = 0.0
+        # Direction (U/D/L/R) -> key for PWM, from the JoyCon's current mapping
+        self.keys: Dict[str, object] = {}
+        self._held: Set[object] = set()
+        self._phase = 0.0
+        self._rem_x = 0.0
+        self._rem_y = 0.0
+
+    def update(self, raw_x: int, raw_y: int) -> None:
+        self.x, self.y = self.calibration.normalize(raw_x, raw_y)
+
+    def set_keys(self, keys: Dict[str, object]) -> None:
+        if keys != self.keys:
+            self.release()
+            self.keys = keys
+
+    def shaped(self) -> Tuple[float, float]:
+        """Deflection after the radial deadzone and response curve, each axis in -1..1."""
+        x, y = self.x, self.y
+        magnitude = math.hypot(x, y)
+        deadzone = self.calibration.deadzone
+        if magnitude <= deadzone:
+            return 0.0, 0.0
+        # Rescale so output starts at 0 right at the deadzone edge
+        scaled = min(1.0, (magnitude - deadzone) / (1.0 - deadzone))
+        pos = scaled * _LUT_SIZE
+        lo = min(int(pos), _LUT_SIZE - 1)
+        table = self.table
+        out = table[lo] + (table[lo + 1] - table[lo]) * (pos - lo)
+        factor = out / magnitude
+        return x * factor, y * factor
+
+    def tick(self, dt: float) -> None:
+        x, y = self.shaped()
+        if self.mode == "pointer":
+            self._rem_x += x * self.speed * dt
+            self._rem_y += y * self.speed * dt
+            dx = int(self._rem_x)
+            dy = int(self._rem_y)
+            if dx or dy:
+                self._rem_x -= dx
+                self._rem_y -= dy
+                move_mouse(dx, dy)
+            return
+
+        self._phase = (self._phase + dt / self.pwm_period) % 1.0
+        target = []
+        keys = self.keys
+        # Each axis holds its key for |deflection| of every period; y runs half a period
+        # out of phase so diagonals don't toggle both keys on the same tick
+        if x and self._phase < abs(x):
+            key = keys.get("R" if x > 0 else "L")
+            if key is not None:
+                target.append(key)
+        if y and (self._phase + 0.5) % 1.0 < abs(y):
+            key = keys.get("D" if y > 0 else "U")
+            if key is not None:
+                target.append(key)
+        if len(target) != len(self._held) or not self._held.issuperset(target):
+            self._held = update_stick_keys(self.stick_id, target, self._held)
+
+    def release(self) -> None:
+        if self._held:
+            self._held = update_stick_keys(self.stick_id, (), self._held)
+        self._rem_x = self._rem_y = 0.0
+
+
+class StickScheduler:
+    """Ticks every registered AnalogStick at a fixed rate on ``loop``.
+
+    Deadlines are start + n * period on the loop's monotonic clock, so timer
+    lateness never accumulates; if the loop falls more than a period behind,
+    missed ticks are skipped rather than replayed in a burst.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, rate_hz: float = DEFAULT_OUTPUT_HZ) -> None:
+        self.loop = loop
+        self.period = 1.0 / rate_hz
+        self._sticks: List[AnalogStick] = []
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._deadline = 0.0
+        self.ticks = 0
+        self.skipped = 0
+
+    def set_rate(self, rate_hz: float) -> None:
+        self.period = 1.0 / rate_hz
+
+    def add(self, stick: AnalogStick) -> None:
+        if stick not in self._sticks:
+            self._sticks.append(stick)
+        if self._handle is None:
+            self._deadline = self.loop.time() + self.period
+            self._handle = self.loop.call_at(self._deadline, self._tick)
+
+    def remove(self, stick: AnalogStick) -> None:
+        if stick in self._sticks:
+            self._sticks.remove(stick)
+            stick.release()
+        if not self._sticks and self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick(self) -> None:
+        period = self.period
+        for stick in self._sticks:
+            stick.tick(period)
+        self.ticks += 1
+        self._deadline += period
+        now = self.loop.time()
+        if now > self._deadline:
+            missed = int((now - self._deadline) / period) + 1
+            self.skipped += missed
+            self._deadline += missed * period
+        self._handle = self.loop.call_at(self._deadline, self._tick)
+
+
+_scheduler: Optional[StickScheduler] = None
+
+
+def get_stick_scheduler() -> StickScheduler:
+    global _scheduler
+    if _scheduler is None:
+        from runtime import get_runtime
+        _scheduler = StickScheduler(get_runtime().loop)
+    return _scheduler
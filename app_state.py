@@ -1,27 +1,47 @@
 from __future__ import annotations
 
-from typing import Set
+import threading
+from typing import FrozenSet, NamedTuple, Optional
 
-_connected_sides: Set[str] = set()
+
+class Topology(NamedTuple):
+    """Immutable snapshot of which Joy-Con sides are connected."""
+    version: int
+    sides: FrozenSet[str]
+    # The only connected side in single mode, None with zero or two controllers
+    single: Optional[str]
+
+
+# The current snapshot. Replaced as a whole under _lock, never mutated, so a
+# reader on any thread sees either the old or the new topology, never a mix.
+# Hot paths read it directly as ``app_state.topology``.
+topology = Topology(0, frozenset(), None)
+_lock = threading.Lock()
+
+
+def _publish(sides: FrozenSet[str]) -> None:
+    global topology
+    single = next(iter(sides)) if len(sides) == 1 else None
+    topology = Topology(topology.version + 1, sides, single)
 
 
 def register_controller(side: str) -> None:
     side_norm = side.lower()
-    _connected_sides.add(side_norm)
+    with _lock:
+        if side_norm not in topology.sides:
+            _publish(topology.sides | {side_norm})
 
 
 def unregister_controller(side: str) -> None:
     side_norm = side.lower()
-    _connected_sides.discard(side_norm)
+    with _lock:
+        if side_norm in topology.sides:
+            _publish(topology.sides - {side_norm})
 
 
 def is_single_controller_mode() -> bool:
-    return len(_connected_sides) == 1
+    return topology.single is not None
 
 
 def which_single_controller() -> str | None:
-    if len(_connected_sides) == 1:
-        return next(iter(_connected_sides))
-    return None
-
-
+    return topology.single
@@ -0,0 +1,564 @@
+"""Benchmarks for the input report hot path.
+
+``python benchmark.py`` runs the before/after micro-benchmarks; they only need
+the standard library.
+
+``python benchmark.py suite [--save FILE] [--compare FILE]`` first runs a few
+correctness checks of the fast paths, then drives the full JoyCon mapping path
+with synthetic report streams through the null output sink and reports latency
+percentiles, throughput and allocations per report.
+``--save`` writes the results as a JSON baseline and ``--compare`` flags any
+scenario that got slower than that baseline. Neither mode needs Bluetooth or
+an accessibility-enabled desktop.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import struct
+import sys
+import time
+import timeit
+import tracemalloc
+
+from gyro_aim import GyroAim
+from link_quality import LinkQuality
+from report_decoder import PACKET_ID_MODULUS, ReportFrame, decode_report
+from stick_quantizer import StickState, exact_sector, get_quantizer, verify
+
+# Captured right Joy-Con report (SR held), see solo_logic.py
+SAMPLE_REPORT = bytes.fromhex(
+    "BCCB0000100000E0FF0FFFF77FDD077EA40074017711770C000000000000004D0E00"
+    "0000000000000001000000000000000000000000000000000000000000"
+)
+
+
+def _legacy_decode(data: bytes, is_left: bool) -> None:
+    # The per-report decoding work JoyCon/solo_logic did before report_decoder
+    offset = 4 if is_left else 3
+    int.from_bytes(data[offset:offset + 3], "big")
+    int.from_bytes(data[offset:offset + 3], "big")
+    stick_data = data[10:13] if is_left else data[13:16]
+    raw_x = ((stick_data[1] & 0x0F) << 8) | stick_data[0]
+    raw_y = (stick_data[2] << 4) | ((stick_data[1] & 0xF0) >> 4)
+    (raw_x - 2048) / 2048.0
+    (raw_y - 2048) / 2048.0
+
+    def to_signed_16(b1, b2):
+        return int.from_bytes(bytes([b1, b2]), byteorder="little", signed=True)
+
+    for base in (0x30, 0x36):
+        to_signed_16(data[base], data[base + 1])
+        to_signed_16(data[base + 2], data[base + 3])
+        to_signed_16(data[base + 4], data[base + 5])
+
+
+def bench_decode(number: int = 200_000) -> dict[str, float]:
+    data = bytearray(SAMPLE_REPORT)
+    frame = ReportFrame()
+    before = min(timeit.repeat(lambda: _legacy_decode(data, False), number=number, repeat=3))
+    after = min(timeit.repeat(lambda: decode_report(data, frame), number=number, repeat=3))
+    return {
+        "before_us": before / number * 1e6,
+        "after_us": after / number * 1e6,
+    }
+
+
+def bench_sticks(number: int = 200_000) -> dict[str, float]:
+    rng = random.Random(1)
+    samples = [(rng.randrange(4096), rng.randrange(4096)) for _ in range(number)]
+    quantizer = get_quantizer()
+    sector = quantizer.sector
+
+    def run_exact():
+        for x, y in samples:
+            exact_sector(x, y)
+
+    def run_table():
+        for x, y in samples:
+            sector(x, y)
+
+    before = min(timeit.repeat(run_exact, number=1, repeat=3))
+    after = min(timeit.repeat(run_table, number=1, repeat=3))
+    return {
+        "before_us": before / number * 1e6,
+        "after_us": after / number * 1e6,
+    }
+
+
+def bench_event_loop(controllers: int = 2, rate_hz: int = 250, seconds: float = 2.0) -> dict[str, float]:
+    """Loop cost of delivering notifications through a coroutine vs a plain callback.
+
+    Mirrors what bleak does: a coroutine callback is wrapped in a task per
+    packet, a plain callback is invoked directly from the loop.
+    """
+    number = int(controllers * rate_hz * seconds)
+    frames = [ReportFrame() for _ in range(controllers)]
+    data = bytearray(SAMPLE_REPORT)
+
+    async def handle_async(sender, payload, frame):
+        decode_report(payload, frame)
+
+    async def cb(sender, payload, frame):
+        await handle_async(sender, payload, frame)
+
+    tasks = set()
+
+    def deliver_async(sender, payload, frame):
+        task = asyncio.ensure_future(cb(sender, payload, frame))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def deliver_sync(sender, payload, frame):
+        decode_report(payload, frame)
+
+    def run(deliver) -> float:
+        loop = asyncio.new_event_loop()
+        try:
+            async def drive():
+                for i in range(number):
+                    loop.call_soon(deliver, None, data, frames[i % controllers])
+                # Yield once so every delivery above runs, then wait for spawned tasks
+                await asyncio.sleep(0)
+                if tasks:
+                    await asyncio.gather(*tasks)
+            start = time.perf_counter()
+            loop.run_until_complete(drive())
+            return time.perf_counter() - start
+        finally:
+            loop.close()
+
+    before = min(run(deliver_async) for _ in range(3))
+    after = min(run(deliver_sync) for _ in range(3))
+    rate = controllers * rate_hz
+    return {
+        "before_us": before / number * 1e6,
+        "after_us": after / number * 1e6,
+        # Share of one core spent in the loop at the simulated notification rate
+        "before_cpu_pct": before / number * rate * 100,
+        "after_cpu_pct": after / number * rate * 100,
+    }
+
+
+def synthetic_imu_stream(count: int, rate_hz: int = 250, seed: int = 2) -> list[ReportFrame]:
+    """Frames with a slowly swinging controller at rest under 1 G, timestamps in µs."""
+    rng = random.Random(seed)
+    frames = []
+    step_us = 1_000_000 // rate_hz
+    for i in range(count):
+        frame = ReportFrame()
+        frame.imu_timestamp = (i * step_us + rng.randrange(-200, 200)) & 0xFFFFFFFF
+        frame.gyro_x = int(3000 * math.sin(i / 50)) + rng.randrange(-20, 20)
+        frame.gyro_y = rng.randrange(-20, 20)
+        frame.gyro_z = int(2000 * math.cos(i / 70)) + rng.randrange(-20, 20)
+        frame.accel_x = rng.randrange(-40, 40)
+        frame.accel_y = rng.randrange(-40, 40)
+        frame.accel_z = 4096 + rng.randrange(-40, 40)
+        frame.has_motion = True
+        frames.append(frame)
+    return frames
+
+
+def bench_gyro(controllers: int = 2, rate_hz: int = 250, seconds: float = 20.0) -> dict[str, float]:
+    count = int(rate_hz * seconds)
+    streams = [synthetic_imu_stream(count, rate_hz, seed=i) for i in range(controllers)]
+    filters = [GyroAim() for _ in range(controllers)]
+
+    def run():
+        for f in filters:
+            f.reset()
+        for i in range(count):
+            for c in range(controllers):
+                filters[c].update(streams[c][i])
+
+    elapsed = min(timeit.repeat(run, number=1, repeat=3))
+    updates = count * controllers
+    per_update = elapsed / updates
+    return {
+        "update_us": per_update * 1e6,
+        # Share of one core at the real rate of every controller streaming
+        "cpu_pct": per_update * rate_hz * controllers * 100,
+    }
+
+
+def bench_timer_wheel(counts: tuple[int, ...] = (4, 64, 512), seconds: float = 10.0) -> dict[int, dict[str, float]]:
+    """Per-tick cost of the macro timer wheel with ``n`` timers active.
+
+    ``idle`` keeps n long timers pending (held tap/hold buttons) that never
+    fire during the run: the pure bookkeeping cost of the wheel. ``turbo``
+    reschedules n timers every half period of a 15 Hz turbo, the way
+    macros.Turbo does.
+    """
+    from timer_wheel import DEFAULT_TICK, TimerWheel
+
+    ticks = int(seconds / DEFAULT_TICK)
+    half_period = 0.5 / 15
+    results = {}
+    for n in counts:
+        row = {}
+        for kind in ("idle", "turbo"):
+            wheel = TimerWheel()
+            if kind == "idle":
+                for _ in range(n):
+                    wheel.schedule(3600.0, lambda: None)
+            else:
+                def toggle():
+                    wheel.schedule(half_period, toggle)
+                for _ in range(n):
+                    wheel.schedule(half_period, toggle)
+            start = time.perf_counter()
+            for i in range(1, ticks + 1):
+                wheel.advance(i * DEFAULT_TICK)
+            elapsed = time.perf_counter() - start
+            row[f"{kind}_tick_us"] = elapsed / ticks * 1e6
+            if kind == "turbo":
+                row["turbo_fire_us"] = elapsed / max(1, wheel.fired) * 1e6
+        results[n] = row
+    return results
+
+
+def bench_stick_hysteresis(rate_hz: int = 250, seconds: float = 10.0, noise: float = 12.0) -> dict[str, dict[str, float]]:
+    """Direction changes per second for a stick resting on an edge, with and without hysteresis.
+
+    ``sector`` parks the stick on the 22.5 degree line between Right and
+    Up-Right, ``deadzone`` on the rim of the deadzone; both jitter by
+    ``noise`` raw units like a real resting stick. Every change costs a key
+    release and/or press.
+    """
+    count = int(rate_hz * seconds)
+    quantizer = get_quantizer()
+    center, span, deadzone = quantizer.params[0], quantizer.params[2], quantizer.params[4]
+    results = {}
+    for name, radius, angle in (("sector", 0.6, 22.5), ("deadzone", deadzone, 90.0)):
+        rng = random.Random(1)
+        base_x = center + radius * span * math.cos(math.radians(angle))
+        base_y = center - radius * span * math.sin(math.radians(angle))
+        samples = [(int(base_x + rng.gauss(0, noise)), int(base_y + rng.gauss(0, noise))) for _ in range(count)]
+        row = {}
+        for label, state in (("before", StickState(quantizer, 0.0, 0.0)), ("after", StickState(quantizer))):
+            changes = 0
+            code = state.code
+            for x, y in samples:
+                new = state.sector(x, y)
+                if new != code:
+                    changes += 1
+                    code = new
+            row[f"{label}_per_s"] = changes / seconds
+        row["suppressed"] = state.suppressed
+        results[name] = row
+    return results
+
+
+def bench_link_quality(number: int = 200_000) -> dict[str, float]:
+    """Cost of the per-report sequence check on a stream with 1% of neighbours swapped."""
+    rng = random.Random(1)
+    reports = []
+    for i in range(number):
+        data = bytearray(SAMPLE_REPORT)
+        data[0:3] = (i & 0xFFFFFF).to_bytes(3, "little")
+        reports.append(bytes(data))
+    for i in range(0, number - 1, 2):
+        if rng.random() < 0.01:
+            reports[i], reports[i + 1] = reports[i + 1], reports[i]
+
+    def run():
+        link = LinkQuality()
+        accept = link.accept
+        for data in reports:
+            accept(data)
+        return link
+
+    elapsed = min(timeit.repeat(run, number=1, repeat=3))
+    return {"accept_us": elapsed / number * 1e6, **run().stats()}
+
+
+def correctness_checks() -> list[str]:
+    """Behaviour the fast paths must keep; run by the suite before timing anything."""
+    failures = []
+
+    # The quantizer table must agree with the exact math over the whole raw input space,
+    # both for an ideal stick and for a calibrated (off-center, asymmetric) one.
+    # Exhaustive, so this is most of the time the checks take (~30 s per table).
+    for params in ((2048, 2048, 2048.0, 2048.0, 0.15), (2100, 1998, 1699.0, 1647.0, 0.2)):
+        mismatches = verify(get_quantizer(4, *params))
+        if mismatches:
+            failures.append(f"stick quantizer {params}: {mismatches} samples differ from exact_sector")
+
+    # Turning stick_min_hold back off must not leave the stick latched on its last direction
+    state = StickState(get_quantizer(), min_hold=0.05)
+    state.sector(4000, 2048)
+    state.min_hold = 0.0
+    if state.sector(100, 2048) != 4:
+        failures.append("stick hysteresis: direction stuck after min_hold was set back to 0")
+
+    # Truncated reports of any length decode without raising inside the notify callback
+    frame = ReportFrame()
+    for length in range(len(SAMPLE_REPORT) + 1):
+        try:
+            decode_report(SAMPLE_REPORT[:length], frame)
+        except Exception as e:
+            failures.append(f"report decode: {length} byte report raised {e!r}")
+
+    return failures
+
+
+def _print_comparison(name: str, result: dict[str, float]) -> None:
+    print(f"{name}: before {result['before_us']:.2f} µs, "
+          f"after {result['after_us']:.2f} µs "
+          f"({result['before_us'] / result['after_us']:.1f}x)")
+
+
+# --- Suite -----------------------------------------------------------------
+
+SUITE_REPORTS = 20_000
+# A scenario is reported as a regression when p50 or p99 grows by more than this
+REGRESSION_THRESHOLD = 0.10
+
+_BUTTON_WORD = struct.Struct(">I")
+_MOTION = struct.Struct("<Ih3h3h")
+
+
+def encode_report(side: str, buttons: int = 0, stick: tuple[int, int] = (2048, 2048),
+                  packet_id: int = 0, imu_timestamp: int = 0) -> bytes:
+    """Build a synthetic common input report, the inverse of report_decoder."""
+    data = bytearray(SAMPLE_REPORT)
+    # Only the 3 counter bytes; byte 3 belongs to the button word
+    data[0:3] = (packet_id % PACKET_ID_MODULUS).to_bytes(3, "little")
+    word = _BUTTON_WORD.unpack_from(data, 3)[0]
+    if side == "right":
+        word = (word & 0xFF) | ((buttons & 0xFFFFFF) << 8)
+    else:
+        word = (word & 0xFF000000) | (buttons & 0xFFFFFF)
+    _BUTTON_WORD.pack_into(data, 3, word)
+    x, y = stick
+    packed = (x & 0xFFF) | ((y & 0xFFF) << 12)
+    offset = 0x0A if side == "left" else 0x0D
+    data[offset:offset + 3] = packed.to_bytes(3, "little")
+    _MOTION.pack_into(data, 0x2A, imu_timestamp & 0xFFFFFFFF, 0, 0, 0, 4096, 0, 0, 0)
+    return bytes(data)
+
+
+def _stream(side: str, count: int, buttons_at, stick_at) -> list[tuple[str, bytes]]:
+    return [
+        (side, encode_report(side, buttons_at(i), stick_at(i), i, i * 4000))
+        for i in range(count)
+    ]
+
+
+def scenario_streams(count: int = SUITE_REPORTS) -> dict[str, tuple[list[str], list[tuple[str, bytes]]]]:
+    """Scenario name -> (connected sides, [(side, report), ...])."""
+    from mapping import MASKS
+
+    rng = random.Random(3)
+    right_masks = list(MASKS["right"].values())
+    left_masks = list(MASKS["left"].values())
+
+    def mash(masks):
+        words = [0]
+        for _ in range(count):
+            # A button flips roughly every fourth report
+            word = words[-1]
+            if rng.random() < 0.25:
+                word ^= rng.choice(masks)
+            words.append(word)
+        return lambda i: words[i]
+
+    def sweep(i):
+        # Full-radius circle with a pass through the center every 500 reports
+        if (i // 250) % 2:
+            return 2048, 2048
+        angle = i * 2 * math.pi / 250
+        return int(2048 + 1600 * math.cos(angle)), int(2048 + 1600 * math.sin(angle))
+
+    centered = lambda i: (2048, 2048)  # noqa: E731
+    no_buttons = lambda i: 0  # noqa: E731
+
+    left_dual = _stream("left", count // 2, mash(left_masks), sweep)
+    right_dual = _stream("right", count // 2, mash(right_masks), sweep)
+    dual = [r for pair in zip(left_dual, right_dual) for r in pair]
+    return {
+        "idle": (["right"], _stream("right", count, no_buttons, centered)),
+        "button_mash": (["right"], _stream("right", count, mash(right_masks), centered)),
+        "stick_sweep": (["left"], _stream("left", count, no_buttons, sweep)),
+        "dual": (["left", "right"], dual),
+    }
+
+
+def _percentiles(samples_ns: list[int]) -> dict[str, float]:
+    ordered = sorted(samples_ns)
+    last = len(ordered) - 1
+
+    def pick(p: float) -> float:
+        return ordered[min(last, int(p * len(ordered)))] / 1000
+
+    return {"p50_us": pick(0.50), "p90_us": pick(0.90), "p99_us": pick(0.99), "max_us": ordered[-1] / 1000}
+
+
+def run_scenario(sides: list[str], reports: list[tuple[str, bytes]]) -> dict[str, object]:
+    import app_state
+    from joycon import JoyCon
+    from solo_logic import decode_accel, decode_gyro
+    from utils import decode_joystick
+
+    for side in app_state.topology.sides:
+        app_state.unregister_controller(side)
+    for side in sides:
+        app_state.register_controller(side)
+    gamepads = {side: JoyCon(side) for side in sides}
+
+    steps = {
+        "process_buttons": lambda pad, data: pad.process_buttons(data),
+        "process_sticks": lambda pad, data: pad.process_sticks(data),
+        "decode_joystick": lambda pad, data: decode_joystick(data[10:13] if pad.is_left else data[13:16]),
+        "decode_gyro": lambda pad, data: decode_gyro(data),
+        "decode_accel": lambda pad, data: decode_accel(data),
+    }
+    step_fns = list(steps.values())
+
+    def run_once() -> None:
+        for side, data in reports:
+            pad = gamepads[side]
+            for fn in step_fns:
+                fn(pad, data)
+
+    # Warm up tables, caches and the output worker before measuring
+    run_once()
+
+    # Throughput without per-call timers
+    start = time.perf_counter()
+    run_once()
+    elapsed = time.perf_counter() - start
+
+    # Per-report and per-step latency
+    clock = time.perf_counter_ns
+    per_report: list[int] = []
+    per_step: dict[str, list[int]] = {name: [] for name in steps}
+    step_items = [(per_step[name], fn) for name, fn in steps.items()]
+    for side, data in reports:
+        pad = gamepads[side]
+        report_start = clock()
+        for samples, fn in step_items:
+            t0 = clock()
+            fn(pad, data)
+            samples.append(clock() - t0)
+        per_report.append(clock() - report_start)
+
+    # Allocations: blocks still alive afterwards (leaks/growth) and the peak
+    # memory one pass needs on top of what was already allocated
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    run_once()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = sys.getallocatedblocks() - blocks_before
+
+    count = len(reports)
+    return {
+        "reports": count,
+        "reports_per_s": count / elapsed if elapsed else 0.0,
+        "latency": _percentiles(per_report),
+        "steps": {name: _percentiles(samples) for name, samples in per_step.items()},
+        "retained_blocks_per_report": retained / count,
+        "peak_bytes_per_report": peak / count,
+    }
+
+
+def run_suite(count: int = SUITE_REPORTS) -> dict[str, object]:
+    from output import NullBackend, configure_output
+
+    worker = configure_output(NullBackend())
+    results = {name: run_scenario(sides, reports) for name, (sides, reports) in scenario_streams(count).items()}
+    worker.flush()
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scenarios": results,
+    }
+
+
+def compare_to_baseline(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """Human readable regressions of ``current`` against ``baseline``."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for key in ("p50_us", "p99_us"):
+            before = base["latency"][key]
+            after = result["latency"][key]
+            if before and (after - before) / before > threshold:
+                regressions.append(f"{name} {key}: {before:.2f} -> {after:.2f} µs (+{(after - before) / before:.0%})")
+    return regressions
+
+
+def _print_suite(result: dict) -> None:
+    for name, scenario in result["scenarios"].items():
+        latency = scenario["latency"]
+        print(f"{name:12s} {scenario['reports_per_s']:>9.0f} reports/s  "
+              f"p50 {latency['p50_us']:.2f} µs  p90 {latency['p90_us']:.2f} µs  "
+              f"p99 {latency['p99_us']:.2f} µs  max {latency['max_us']:.1f} µs  "
+              f"retained {scenario['retained_blocks_per_report']:.3f} blocks/report  "
+              f"peak {scenario['peak_bytes_per_report']:.1f} B/report")
+        for step, stats in scenario["steps"].items():
+            print(f"    {step:16s} p50 {stats['p50_us']:.2f} µs  p99 {stats['p99_us']:.2f} µs")
+
+
+def _run_micro() -> None:
+    _print_comparison("report decode", bench_decode())
+    _print_comparison("stick quantize (atan2 vs table)", bench_sticks())
+    loop_result = bench_event_loop()
+    _print_comparison("notification dispatch (coroutine vs callback)", loop_result)
+    print(f"  loop CPU at 2 x 250 Hz: before {loop_result['before_cpu_pct']:.2f}%, "
+          f"after {loop_result['after_cpu_pct']:.2f}%")
+    print("macro timer wheel (per 5 ms tick):")
+    for n, row in bench_timer_wheel().items():
+        print(f"  {n:4d} timers: idle {row['idle_tick_us']:.2f} µs/tick, "
+              f"turbo {row['turbo_tick_us']:.2f} µs/tick ({row['turbo_fire_us']:.2f} µs/timer fired)")
+    print("stick edge chatter at 250 Hz (direction changes/s):")
+    for name, row in bench_stick_hysteresis().items():
+        print(f"  {name:8s} before {row['before_per_s']:.1f}/s, after {row['after_per_s']:.1f}/s "
+              f"({row['suppressed']} flips suppressed)")
+    link_result = bench_link_quality()
+    print(f"sequence check: {link_result['accept_us']:.2f} µs/report "
+          f"({link_result['stale'] + link_result['duplicates']} of {link_result['received']} discarded)")
+    gyro_result = bench_gyro()
+    print(f"gyro aim filter: {gyro_result['update_us']:.2f} µs/update, "
+          f"{gyro_result['cpu_pct']:.2f}% CPU at 2 x 250 Hz")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", nargs="?", choices=("micro", "suite"), default="micro")
+    parser.add_argument("--reports", type=int, default=SUITE_REPORTS, help="reports per suite scenario")
+    parser.add_argument("--save", metavar="FILE", help="write suite results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare suite results to a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="relative p50/p99 slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.mode == "micro":
+        _run_micro()
+        sys.exit(0)
+
+    failures = correctness_checks()
+    for line in failures:
+        print(f"FAILED {line}")
+    if failures:
+        sys.exit(1)
+
+    result = run_suite(args.reports)
+    _print_suite(result)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"baseline written to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_to_baseline(result, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
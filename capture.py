@@ -0,0 +1,150 @@
+"""Append-only capture of raw BLE input reports, and a replay driver.
+
+File layout: an 8 byte header (``MAGIC``), then one record per notification:
+``<d`` monotonic timestamp, ``B`` side (0=left, 1=right, 255=unknown),
+``H`` payload length, followed by the raw report bytes.
+
+Capture is enabled by launching the app with ``JOYCON2MOUSE_CAPTURE=<path>``.
+Replay with ``python capture.py <path> [--realtime] [--speed N] [--output null|pynput]``.
+"""
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+MAGIC = b"JC2CAP\x01\x00"
+_RECORD = struct.Struct("<dBH")
+
+SIDE_CODES = {"left": 0, "right": 1}
+SIDE_NAMES = {0: "left", 1: "right"}
+SIDE_UNKNOWN = 0xFF
+
+
+class CaptureWriter:
+    # The tray quits with os._exit, so flush regularly instead of relying on close()
+    FLUSH_EVERY = 250
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new_file:
+            self._file.write(MAGIC)
+        self.records = 0
+
+    def record(self, side: Optional[str], data: bytes) -> None:
+        side_code = SIDE_CODES.get(side.lower(), SIDE_UNKNOWN) if side else SIDE_UNKNOWN
+        self._file.write(_RECORD.pack(time.monotonic(), side_code, len(data)))
+        self._file.write(data)
+        self.records += 1
+        if self.records % self.FLUSH_EVERY == 0:
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+_writer: Optional[CaptureWriter] = None
+
+
+def get_capture() -> Optional[CaptureWriter]:
+    """Process-wide writer if JOYCON2MOUSE_CAPTURE is set, else None."""
+    global _writer
+    if _writer is None:
+        path = os.environ.get("JOYCON2MOUSE_CAPTURE")
+        if path:
+            _writer = CaptureWriter(path)
+    return _writer
+
+
+def iter_capture(path: str) -> Iterator[Tuple[float, int, memoryview]]:
+    """Yield (timestamp, side code, payload) from a capture file without copying payloads.
+
+    Each payload is a memoryview into the mapped file and is released once the
+    caller asks for the next record; copy it with bytes() to keep it.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a JoyCon2Mouse capture")
+            view = memoryview(mm)
+            try:
+                offset = len(MAGIC)
+                end = len(mm)
+                header_size = _RECORD.size
+                while offset + header_size <= end:
+                    ts, side, length = _RECORD.unpack_from(mm, offset)
+                    offset += header_size
+                    if offset + length > end:
+                        break  # truncated tail from an interrupted capture
+                    payload = view[offset:offset + length]
+                    try:
+                        yield ts, side, payload
+                    finally:
+                        # Payloads are only valid until the next record is read
+                        payload.release()
+                    offset += length
+            finally:
+                view.release()
+
+
+def replay(path: str, realtime: bool = False, speed: float = 1.0) -> Dict[str, float]:
+    """Feed a capture through the JoyCon pipeline, as fast as possible or in real time."""
+    from app_state import register_controller
+    from joycon import JoyCon
+
+    # Topology first, so single/dual mapping matches the captured session
+    sides = {side for _, side, _ in iter_capture(path) if side in SIDE_NAMES}
+    gamepads = {}
+    for side in sides:
+        register_controller(SIDE_NAMES[side])
+        gamepads[side] = JoyCon(side=SIDE_NAMES[side])
+
+    reports = skipped = 0
+    first_ts = None
+    start = time.perf_counter()
+    for ts, side, payload in iter_capture(path):
+        gamepad = gamepads.get(side)
+        if gamepad is None:
+            skipped += 1
+            continue
+        if realtime:
+            if first_ts is None:
+                first_ts = ts
+            delay = (ts - first_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        gamepad.process_report(payload)
+        reports += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "reports": reports,
+        "skipped": skipped,
+        # Discarded by the sequence check as duplicated or out of order
+        "discarded": sum(pad.link.duplicates + pad.link.stale for pad in gamepads.values()),
+        "elapsed_s": elapsed,
+        "reports_per_s": reports / elapsed if elapsed else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a JoyCon2Mouse capture")
+    parser.add_argument("path")
+    parser.add_argument("--realtime", action="store_true", help="keep the captured timing")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale for --realtime")
+    parser.add_argument("--output", choices=("null", "pynput"), default="null")
+    args = parser.parse_args()
+
+    from output import NullBackend, PynputBackend, configure_output
+    worker = configure_output(NullBackend() if args.output == "null" else PynputBackend())
+    result = replay(args.path, args.realtime, args.speed)
+    worker.flush()
+    print(f"{result['reports']} reports ({result['skipped']} without a side, {result['discarded']} out of sequence) in "
+          f"{result['elapsed_s']:.3f}s, {result['reports_per_s']:.0f} reports/s")
+    print(worker.stats())
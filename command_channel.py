@@ -0,0 +1,162 @@
+"""Per-client queue for subcommand writes (LEDs, vibration, ...).
+
+Frames are built once and cached. Writes go out one at a time at no more than
+``write_hz``, so a burst of haptics can't crowd the BLE link that carries the
+input notifications. A command queued under the same key as one that hasn't
+been sent yet replaces it: only the newest LED state or vibration matters.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from utils import (
+    COMMAND_LEDS,
+    COMMAND_VIBRATION,
+    SUBCOMMAND_PLAY_VIBRATION_PRESET,
+    SUBCOMMAND_SET_PLAYER_LEDS,
+    WRITE_COMMAND_UUID,
+)
+
+DEFAULT_WRITE_HZ = 30.0
+
+# Reproduce Switch LED patterns for up to 8 players https://en-americas-support.nintendo.com/app/answers/detail/a_id/22424
+LED_PATTERNS = {
+    1: b'\x01',
+    2: b'\x03',
+    3: b'\x07',
+    4: b'\x0F',
+    5: b'\x09',
+    6: b'\x05',
+    7: b'\x0D',
+    8: b'\x06',
+}
+
+
+@lru_cache(maxsize=None)
+def build_command(command_id: int, subcommand_id: int, buffer: bytes) -> bytes:
+    # Pad buffer to 8 bytes minimum because some buffer lengths seems to crash
+    buffer = buffer.ljust(8, b'\0')
+    return bytes((command_id, 0x91, 0x01, subcommand_id, 0x00, len(buffer), 0x00, 0x00)) + buffer
+
+
+def led_frame(player_number: int) -> bytes:
+    return build_command(COMMAND_LEDS, SUBCOMMAND_SET_PLAYER_LEDS, LED_PATTERNS[min(player_number, 8)])
+
+
+def vibration_frame(preset_id: int) -> bytes:
+    return build_command(COMMAND_VIBRATION, SUBCOMMAND_PLAY_VIBRATION_PRESET, bytes((preset_id,)))
+
+
+class CommandChannel:
+    """Serialises, merges and paces writes to one client's command characteristic.
+
+    Lives on the runtime loop; ``send`` must be awaited (or scheduled) there.
+    """
+
+    def __init__(self, client, write_hz: float = DEFAULT_WRITE_HZ) -> None:
+        self.client = client
+        self.interval = 1.0 / write_hz if write_hz > 0 else 0.0
+        # key -> [frame, response, waiters]; dicts keep insertion order, so this is the queue
+        self._pending: Dict[object, list] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._next_write = 0.0
+        self._unique = itertools.count()
+        self._without_response: Optional[bool] = None
+        self.writes = 0
+        self.merged = 0
+
+    def send(self, frame: bytes, key: object = None, response: bool = False) -> asyncio.Future:
+        """Queue ``frame``; the returned future resolves once it has been written.
+
+        ``key`` names what the command controls (e.g. "leds"); a queued frame
+        with the same key is replaced. ``response=True`` forces a write with
+        response, so the future only resolves once the controller acked it.
+        """
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        if key is None:
+            key = next(self._unique)
+        entry = self._pending.get(key)
+        if entry is None:
+            self._pending[key] = [frame, response, [waiter]]
+        else:
+            entry[0] = frame
+            entry[1] = entry[1] or response
+            entry[2].append(waiter)
+            self.merged += 1
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        self._wakeup.set()
+        return waiter
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for _, _, waiters in self._pending.values():
+            for waiter in waiters:
+                waiter.cancel()
+        self._pending.clear()
+
+    def _supports_without_response(self) -> bool:
+        if self._without_response is None:
+            try:
+                char = self.client.services.get_characteristic(WRITE_COMMAND_UUID)
+                self._without_response = "write-without-response" in char.properties
+            except Exception:
+                self._without_response = False
+        return self._without_response
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            while self._pending:
+                wait = self._next_write - loop.time()
+                if wait > 0:
+                    # Pop only after the wait, so anything queued meanwhile can still merge
+                    await asyncio.sleep(wait)
+                key = next(iter(self._pending))
+                frame, response, waiters = self._pending.pop(key)
+                await self._write(frame, response, waiters)
+                self._next_write = loop.time() + self.interval
+            self._wakeup.clear()
+
+    async def _write(self, frame: bytes, response: bool, waiters: List[asyncio.Future]) -> None:
+        try:
+            await self.client.write_gatt_char(
+                WRITE_COMMAND_UUID, frame, response=response or not self._supports_without_response()
+            )
+        except Exception as e:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        self.writes += 1
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def command_channel(client, write_hz: Optional[float] = None) -> CommandChannel:
+    """The client's channel, created on first use."""
+    channel = getattr(client, "_commands", None)
+    if channel is None:
+        channel = client._commands = CommandChannel(client, write_hz or DEFAULT_WRITE_HZ)
+    return channel
+
+
+async def write_command(client, command_id, subcommand_id, buffer, response=False):
+    await command_channel(client).send(build_command(command_id, subcommand_id, bytes(buffer)), response=response)
+
+
+async def play_vibration_preset(client, preset_id, response=False):
+    await command_channel(client).send(vibration_frame(preset_id), "vibration", response)
+
+
+async def set_leds(client, player_number, response=False):
+    await command_channel(client).send(led_frame(player_number), "leds", response)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import math
+from typing import Optional, Tuple
+
+from report_decoder import GYRO_SCALE, ReportFrame
+
+DEFAULT_OUTPUT_HZ = 125.0
+# Samples further apart than this (reconnect, long BLE stall) only re-seed the clock
+MAX_SAMPLE_GAP = 0.1
+# Accel readings further than this from 1 G are motion, not gravity, and are ignored
+GRAVITY_TOLERANCE = 0.2
+_ONE_G_RAW = 4096
+_DEG_TO_RAD = math.pi / 180.0
+
+
+class GyroAim:
+    """Gyro-to-pointer with a complementary filter tracking the gravity vector.
+
+    All state is a handful of floats per controller and ``update`` allocates
+    nothing unless a move is due. Time steps come from the IMU sample
+    timestamp in the report rather than the wall clock, so jitter in BLE
+    delivery does not show up as pointer jitter.
+
+    Yaw is taken around the estimated gravity axis ("player space"), so
+    turning left and right behaves the same however the controller is held.
+    """
+
+    __slots__ = (
+        "sensitivity",
+        "yaw_sign",
+        "pitch_sign",
+        "alpha",
+        "noise_dps",
+        "interval",
+        "_grav_x",
+        "_grav_y",
+        "_grav_z",
+        "_last_ts",
+        "_clock",
+        "_next_emit",
+        "_acc_x",
+        "_acc_y",
+    )
+
+    def __init__(self, sensitivity: float = 8.0, output_hz: float = DEFAULT_OUTPUT_HZ,
+                 alpha: float = 0.02, noise_dps: float = 0.5,
+                 invert_x: bool = False, invert_y: bool = False) -> None:
+        # sensitivity is pixels per degree of rotation
+        self.sensitivity = sensitivity
+        self.yaw_sign = 1.0 if invert_x else -1.0
+        self.pitch_sign = 1.0 if invert_y else -1.0
+        self.alpha = alpha
+        self.noise_dps = noise_dps
+        self.interval = 1.0 / output_hz if output_hz > 0 else 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        self._grav_x = 0.0
+        self._grav_y = 0.0
+        self._grav_z = 1.0
+        self._last_ts = -1
+        self._clock = 0.0
+        self._next_emit = 0.0
+        self._acc_x = 0.0
+        self._acc_y = 0.0
+
+    def update(self, frame: ReportFrame) -> Optional[Tuple[int, int]]:
+        """Feed one decoded report; returns a whole-pixel (dx, dy) when due."""
+        ts = frame.imu_timestamp
+        last = self._last_ts
+        self._last_ts = ts
+        if last < 0:
+            return None
+        dt = ((ts - last) & 0xFFFFFFFF) * 1e-6
+        if dt <= 0.0 or dt > MAX_SAMPLE_GAP:
+            return None
+        self._clock += dt
+
+        wx = frame.gyro_x * GYRO_SCALE
+        wy = frame.gyro_y * GYRO_SCALE
+        wz = frame.gyro_z * GYRO_SCALE
+
+        # Predict: gravity seen from the controller rotates opposite to the body
+        gx = self._grav_x
+        gy = self._grav_y
+        gz = self._grav_z
+        step = dt * _DEG_TO_RAD
+        px = gx - (wy * gz - wz * gy) * step
+        py = gy - (wz * gx - wx * gz) * step
+        pz = gz - (wx * gy - wy * gx) * step
+
+        # Correct: pull towards the accelerometer when it is measuring gravity only
+        ax = frame.accel_x
+        ay = frame.accel_y
+        az = frame.accel_z
+        a_norm = math.sqrt(ax * ax + ay * ay + az * az)
+        if a_norm and abs(a_norm - _ONE_G_RAW) < GRAVITY_TOLERANCE * _ONE_G_RAW:
+            alpha = self.alpha
+            keep = 1.0 - alpha
+            blend = alpha / a_norm
+            px = px * keep + ax * blend
+            py = py * keep + ay * blend
+            pz = pz * keep + az * blend
+        norm = math.sqrt(px * px + py * py + pz * pz)
+        if norm:
+            gx = px / norm
+            gy = py / norm
+            gz = pz / norm
+            self._grav_x = gx
+            self._grav_y = gy
+            self._grav_z = gz
+
+        yaw_rate = wx * gx + wy * gy + wz * gz
+        pitch_rate = wx
+        noise = self.noise_dps
+        if -noise < yaw_rate < noise:
+            yaw_rate = 0.0
+        if -noise < pitch_rate < noise:
+            pitch_rate = 0.0
+        scale = self.sensitivity * dt
+        self._acc_x += yaw_rate * scale * self.yaw_sign
+        self._acc_y += pitch_rate * scale * self.pitch_sign
+
+        if self._clock < self._next_emit:
+            return None
+        out_x = int(self._acc_x)
+        out_y = int(self._acc_y)
+        if not (out_x or out_y):
+            return None
+        self._acc_x -= out_x
+        self._acc_y -= out_y
+        self._next_emit = self._clock + self.interval
+        return out_x, out_y
@@ -0,0 +1,134 @@
+"""Multi-step vibration patterns played from one timer on the runtime loop.
+
+Every pending step of every effect sits in a single heap ordered by due time;
+one ``loop.call_at`` handle is armed for the earliest step. Steps are sent as
+precomputed vibration frames through the client's command channel, so they are
+paced and merged with any other vibration writes.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import weakref
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from command_channel import command_channel, vibration_frame
+
+# name -> ((offset in seconds from the start, vibration preset id), ...)
+PATTERNS: Dict[str, Tuple[Tuple[float, int], ...]] = {
+    "pulse": ((0.0, 0x04),),
+    "double_pulse": ((0.0, 0x04), (0.18, 0x04)),
+    "triple_pulse": ((0.0, 0x04), (0.18, 0x04), (0.36, 0x04)),
+}
+
+# Steps this close to the timer firing are sent in the same batch
+_BATCH_SLACK = 0.002
+
+
+@lru_cache(maxsize=None)
+def compile_pattern(name: str) -> Tuple[Tuple[float, bytes], ...]:
+    """(offset, frame) steps for a pattern, built once per name."""
+    return tuple((offset, vibration_frame(preset)) for offset, preset in sorted(PATTERNS[name]))
+
+
+def _consume(waiter: asyncio.Future) -> None:
+    # Effects are fire and forget; a failed write just means the controller dropped
+    if not waiter.cancelled():
+        waiter.exception()
+
+
+class HapticsEngine:
+    """Schedules patterns per client. All methods run on ``loop``."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        # (due, seq, client, generation, frame)
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        # Starting a new effect on a client bumps its generation, dropping older steps
+        self._generations: "weakref.WeakKeyDictionary[object, int]" = weakref.WeakKeyDictionary()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_due = 0.0
+        self.steps_sent = 0
+
+    def play(self, client, pattern: str = "pulse") -> None:
+        """Start ``pattern`` on ``client``, replacing whatever it was playing."""
+        steps = compile_pattern(pattern)
+        generation = self._generations.get(client, 0) + 1
+        self._generations[client] = generation
+        now = self.loop.time()
+        for offset, frame in steps:
+            heapq.heappush(self._heap, (now + offset, next(self._seq), client, generation, frame))
+        self._arm()
+
+    def stop(self, client) -> None:
+        if client in self._generations:
+            self._generations[client] += 1
+
+    def _arm(self) -> None:
+        if not self._heap:
+            return
+        due = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            self._timer.cancel()
+        self._timer = self.loop.call_at(due, self._fire)
+        self._timer_due = due
+
+    def _fire(self) -> None:
+        self._timer = None
+        heap = self._heap
+        limit = self.loop.time() + _BATCH_SLACK
+        while heap and heap[0][0] <= limit:
+            _, _, client, generation, frame = heapq.heappop(heap)
+            if self._generations.get(client) != generation:
+                continue
+            command_channel(client).send(frame, "vibration").add_done_callback(_consume)
+            self.steps_sent += 1
+        self._arm()
+
+
+_engine: Optional[HapticsEngine] = None
+
+
+def get_haptics() -> HapticsEngine:
+    """Process-wide engine on the shared runtime loop."""
+    global _engine
+    if _engine is None:
+        from runtime import get_runtime
+        _engine = HapticsEngine(get_runtime().loop)
+    return _engine
+
+
+class RecordingClient:
+    """Stand-in for a BleakClient that keeps every write with its loop timestamp."""
+
+    def __init__(self, address: str = "00:00:00:00:00:00") -> None:
+        self.address = address
+        self.writes: List[Tuple[float, bytes]] = []
+
+    async def write_gatt_char(self, uuid, data, response=None) -> None:
+        self.writes.append((asyncio.get_running_loop().time(), bytes(data)))
+
+
+if __name__ == "__main__":
+    async def _demo() -> None:
+        loop = asyncio.get_running_loop()
+        engine = HapticsEngine(loop)
+        first, second = RecordingClient("first"), RecordingClient("second")
+        start = loop.time()
+        engine.play(first, "triple_pulse")
+        engine.play(second, "double_pulse")
+        await asyncio.sleep(0.1)
+        # Restarting an effect drops the steps still pending from the previous one
+        engine.play(second, "pulse")
+        await asyncio.sleep(0.5)
+        for client in (first, second):
+            print(client.address, [(round(t - start, 3), frame.hex()) for t, frame in client.writes])
+        assert len(first.writes) == 3 and len(second.writes) == 2
+        assert all(frame == vibration_frame(0x04) for _, frame in first.writes + second.writes)
+
+    asyncio.run(_demo())
@@ -1,16 +1,21 @@
 from __future__ import annotations
 
 from typing import Set, Iterable
-from pynput.keyboard import Key
-from utils import send_key_press, send_key_release
+from output import get_output
 
 
+# Injection happens on the output worker thread so a slow OS call never
+# delays the next BLE notification.
 def press_key(k: object) -> None:
-    send_key_press(k)
+    get_output().press(k)
 
 
 def release_key(k: object) -> None:
-    send_key_release(k)
+    get_output().release(k)
+
+
+def move_mouse(dx: int, dy: int) -> None:
+    get_output().move(dx, dy)
 
 
 def update_stick_keys(stick_id: str, target_keys: Iterable[object], currently_held: Set[object]) -> Set[object]:
@@ -1,207 +1,241 @@
-import logging
-from typing import Dict, Set, Tuple
-import math
-from pynput.keyboard import Key
-from input_mapper import press_key, release_key, update_stick_keys
-from app_state import is_single_controller_mode, which_single_controller
-
-MASKS = {
-    "right": {
-        "A":    0x000800,
-        "B":    0x000400,
-        "X":    0x000200,
-        "Y":    0x000100,
-        "PLUS": 0x000002,
-        "STICK":0x000004,
-        "SL":  0x002000,
-        "SR":  0x001000,
-        "R":  0x004000,
-        "ZR":  0x008000,
-        "HOME": 0x000010,
-        "CHAT": 0x000040,
-    },
-    "left": {
-        "UP":     0x000002,
-        "DOWN":   0x000001,
-        "LEFT":   0x000008,
-        "RIGHT":  0x000004,
-        "MINUS":  0x000100,
-        "STICK":  0x000800,
-        "SHARE":  0x002000,
-        "SL":  0x000020,
-        "SR":  0x000010,
-        "L": 0x000040,
-        "ZL": 0x000080
-    }
-}
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+from input_mapper import move_mouse, press_key, release_key, update_stick_keys
+import app_state
+from app_state import Topology
+from analog_stick import AnalogStick
+from mapping import Profile, compile_button_table, compile_haptic_combos, compile_stick_table, profile_mode, stick_keys
+from gyro_aim import GyroAim
+from link_quality import LinkQuality
+from optical_mouse import DEFAULT_OUTPUT_HZ, OpticalMouse
+from report_decoder import ReportFrame, decode_report
+from stick_calibration import StickCalibrator
+from stick_quantizer import DEFAULT_CALIBRATION, StickCalibration, StickState, get_quantizer
+
+
 class JoyCon:
     def __init__(self, side: str = "right"):
         self.side = side
         self.is_left = side != "right"
-        self._last_data: bytes | None = None
+        # Reused for every report so the hot path does not allocate a new frame
+        self.frame = ReportFrame()
+        # Packet counter tracking; duplicated and out-of-order reports stop here
+        self.link = LinkQuality()
         self._prev_buttons_state: int = 0
+        # bit -> key table for the current controller topology, see _refresh_tables
+        self._button_table: Dict[int, object] = {}
+        self._stick_table: Tuple[frozenset, ...] = ()
+        self.calibration = DEFAULT_CALIBRATION
+        # Quantizer plus hysteresis; see set_stick_hysteresis
+        self.stick_state = StickState(get_quantizer(4, *self.calibration))
+        # Collects raw stick samples instead of mapping them while calibrating
+        self.calibrator: Optional[StickCalibrator] = None
+        # Last sector code sent to update_stick_keys, -1 = none yet
+        self._stick_code: int = -1
+        # Topology snapshot the tables were compiled for; a new snapshot means recompile
+        self._topology: Optional[Topology] = None
+        # Mode ("dual", "single-left", ...) -> user profile, see set_profiles
+        self._profiles: Dict[str, Profile] = {}
         # Track which stick-direction keys are currently held to avoid repeats
         self._held_left_stick_keys: Set[object] = set()
         self._held_right_stick_keys: Set[object] = set()
+        # Optical sensor -> pointer, only while mouse mode is on
+        self.mouse: Optional[OpticalMouse] = None
+        # Gyro -> pointer, only while gyro aim is on
+        self.gyro: Optional[GyroAim] = None
+        # Proportional stick output; None = the 8-way digital keys
+        self.analog: Optional[AnalogStick] = None
+        # Macro engine and the button bits it has claimed on this side, see set_macros
+        self.macros = None
+        self._macro_bits: int = 0
+        # Called with a pattern name when a haptic combo is pressed; None = haptics off
+        self.on_haptic: Optional[Callable[[str], None]] = None
+        self._haptic_combos = compile_haptic_combos(side)
+
+    def set_mouse_mode(self, enabled: bool, sensitivity: float = 1.0,
+                       output_hz: float = DEFAULT_OUTPUT_HZ) -> None:
+        self.mouse = OpticalMouse(sensitivity, output_hz) if enabled else None
+
+    def set_gyro_aim(self, enabled: bool, sensitivity: float = 8.0,
+                     output_hz: float = DEFAULT_OUTPUT_HZ) -> None:
+        self.gyro = GyroAim(sensitivity, output_hz) if enabled else None
+
+    def process_report(self, data: bytes) -> None:
+        if not self.link.accept(data):
+            return
+        # Decode once, then run buttons and sticks off the same frame
+        self.map_frame(decode_report(data, self.frame))
+
+    def map_frame(self, frame: ReportFrame) -> None:
+        self._dispatch_buttons(frame)
+        mouse = self.mouse
+        if mouse is not None and frame.has_sticks:
+            delta = mouse.update(frame.mouse_x, frame.mouse_y, time.perf_counter())
+            if delta is not None:
+                move_mouse(delta[0], delta[1])
+        gyro = self.gyro
+        if gyro is not None and frame.has_motion:
+            delta = gyro.update(frame)
+            if delta is not None:
+                move_mouse(delta[0], delta[1])
+        self._dispatch_sticks(frame)
 
     def process_buttons(self, data: bytes) -> None:
-        button_map = MASKS[self.side]
+        self._dispatch_buttons(decode_report(data, self.frame))
 
-        offset = 4 if self.is_left else 3
-        bits_now = int.from_bytes(data[offset:offset+3], "big")
-        bits_prev = int.from_bytes(self._last_data[offset:offset+3], "big") if self._last_data else 0
+    def process_sticks(self, data: bytes) -> None:
+        self._dispatch_sticks(decode_report(data, self.frame))
 
-        # Map Joy-Con buttons to keyboard keys
-        single_mode = is_single_controller_mode()
-        single_which = which_single_controller() if single_mode else None
+    def reset_link(self) -> None:
+        """Forget per-connection counters; call when the controller disconnects."""
+        self.link.reset()
+        if self.mouse is not None:
+            self.mouse.reset()
+        if self.gyro is not None:
+            self.gyro.reset()
+        if self.analog is not None:
+            # No reports until reconnected, so don't keep steering with the last deflection
+            self.analog.x = self.analog.y = 0.0
+            self.analog.release()
 
-        if self.is_left:
-            # Base mapping for LEFT Joy-Con
-            key_mapping: Dict[str, object] = {
-                "UP": Key.up,
-                "DOWN": Key.down,
-                "LEFT": Key.left,
-                "RIGHT": Key.right,
-                "ZL": "1",
-                "L": "2",
-                "SL": "3",
-                "SR": "4",
-                "MINUS": "5",
-                "SHARE": "z",
-            }
-            # Single-mode override for D-Pad mapping
-            if single_mode and single_which == "left":
-                key_mapping.update({
-                    # Arrow outputs remapped: UP/DOWN/LEFT/RIGHT = DPAD RIGHT/LEFT/UP/DOWN
-                    "RIGHT": Key.up,
-                    "LEFT": Key.down,
-                    "UP": Key.left,
-                    "DOWN": Key.right,
-                })
-        else:
-            # Base mapping for RIGHT Joy-Con
-            key_mapping = {
-                # Default dual-mode face buttons: I=Y, J=X, K=B, L=A
-                "X": "i",
-                "Y": "j",
-                "B": "k",
-                "A": "l",
-                "R": "9",
-                "ZR": "0",
-                "SR": "7",
-                "SL": "8",
-                "PLUS": "6",
-                "HOME": "n",
-                "CHAT": "m",
-            }
-            # Single-mode override for face buttons: IJKL = Y B A X
-            if single_mode and single_which == "right":
-                key_mapping.update({
-                    "Y": "i",
-                    "B": "j",
-                    "A": "k",
-                    "X": "l",
-                    # Swap 7 and 8 for right Joy-Con SL/SR in single mode
-                    "SR": "8",
-                    "SL": "7",
-                })
-
-        for name, mask in button_map.items():
-            now = bool(bits_now & mask)
-            prev = bool(bits_prev & mask)
-            if name in key_mapping:
-                mapped_key = key_mapping[name]
-                if now and not prev:
+    def set_analog(self, analog: Optional[AnalogStick]) -> None:
+        """Switch the stick between 8-way keys (None) and proportional output."""
+        self._release_stick()
+        if analog is not None:
+            analog.calibration = self.calibration
+        self.analog = analog
+        # Recompile so the analog stick gets the current direction keys
+        self._topology = None
+
+    def set_calibration(self, calibration: StickCalibration) -> None:
+        """Compile a stick calibration into the quantizer; costs nothing per report."""
+        if calibration == self.calibration:
+            return
+        self.calibration = calibration
+        self.stick_state.quantizer = get_quantizer(4, *calibration)
+        if self.analog is not None:
+            self.analog.calibration = calibration
+        self._stick_code = -1
+
+    def set_stick_hysteresis(self, angular: float, radial: float, min_hold: float = 0.0) -> None:
+        state = self.stick_state
+        state.angular = angular
+        state.radial = radial
+        state.min_hold = min_hold
+
+    def begin_calibration(self) -> StickCalibrator:
+        """Route raw stick samples to a new calibrator; stick output stops until end_calibration."""
+        self._release_stick()
+        if self.analog is not None:
+            self.analog.x = self.analog.y = 0.0
+        self.calibrator = StickCalibrator()
+        return self.calibrator
+
+    def end_calibration(self) -> None:
+        self.calibrator = None
+        self.stick_state.reset()
+        self._stick_code = -1
+
+    def _release_stick(self) -> None:
+        if self.analog is not None:
+            self.analog.release()
+        held = self._held_left_stick_keys if self.is_left else self._held_right_stick_keys
+        if held:
+            update_stick_keys(self.side, (), held)
+            held.clear()
+        self._stick_code = -1
+
+    def set_macros(self, engine) -> None:
+        """Hand the buttons bound to macros in ``engine`` over to it (None = no macros)."""
+        self.macros = engine
+        self._macro_bits = engine.claimed_bits(self.side) if engine is not None else 0
+
+    def set_profiles(self, profiles: Dict[str, Profile]) -> None:
+        """Swap in new user profiles. Call from the thread that delivers reports."""
+        self._profiles = profiles
+        # Recompile on the next report, exactly like a topology change
+        self._topology = None
+
+    def _refresh_tables(self, topology: Topology) -> None:
+        profile = self._profiles.get(profile_mode(topology.single))
+        old_table = self._button_table
+        self._button_table = compile_button_table(self.side, topology.single, profile)
+        self._stick_table = compile_stick_table(self.side, topology.single, profile)
+        if self.analog is not None:
+            self.analog.set_keys(stick_keys(self.side, topology.single, profile))
+        # Buttons held across the switch: move them to their new key so nothing stays stuck
+        held = self._prev_buttons_state & ~self._macro_bits
+        while held:
+            bit = held & -held
+            held ^= bit
+            old_key = old_table.get(bit)
+            new_key = self._button_table.get(bit)
+            if old_key != new_key:
+                if old_key is not None:
+                    release_key(old_key)
+                if new_key is not None:
+                    press_key(new_key)
+        # Force the held stick keys to be re-diffed against the new table
+        self._stick_code = -1
+        self._topology = topology
+
+    def _dispatch_buttons(self, frame: ReportFrame) -> None:
+        bits_now = frame.buttons_left if self.is_left else frame.buttons_right
+        changed = bits_now ^ self._prev_buttons_state
+        if not changed:
+            return
+        topology = app_state.topology
+        if topology is not self._topology:
+            self._refresh_tables(topology)
+
+        # Visit only the bits that flipped since the last report
+        table = self._button_table
+        macro_bits = self._macro_bits
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            mapped_key = table.get(bit)
+            if bit & macro_bits:
+                self.macros.on_button(self.side, bit, bool(bits_now & bit), mapped_key)
+            elif mapped_key is not None:
+                if bits_now & bit:
                     press_key(mapped_key)
-                elif not now and prev:
+                else:
                     release_key(mapped_key)
-        self._last_data = data
-                    
-
-    def process_sticks(self, data: bytes) -> Tuple[int, int]:
-        stick_data = data[10:13] if self.is_left else data[13:16]
-        if len(stick_data) != 3:
-            return 0, 0
-        raw_x = ((stick_data[1] & 0x0F) << 8) | stick_data[0]
-        raw_y = (stick_data[2] << 4) | ((stick_data[1] & 0xF0) >> 4)
-        x = (raw_x - 2048) / 2048.0
-        y = (raw_y - 2048) / 2048.0
+        on_haptic = self.on_haptic
+        if on_haptic is not None:
+            prev = self._prev_buttons_state
+            for mask, pattern in self._haptic_combos:
+                # Fire once, on the report that completes the combo
+                if bits_now & mask == mask and prev & mask != mask:
+                    on_haptic(pattern)
+        self._prev_buttons_state = bits_now
+
+    def _dispatch_sticks(self, frame: ReportFrame) -> None:
+        if not frame.has_sticks:
+            return
+        if self.is_left:
+            raw_x, raw_y = frame.left_x, frame.left_y
+        else:
+            raw_x, raw_y = frame.right_x, frame.right_y
+        if self.calibrator is not None:
+            self.calibrator.sample(raw_x, raw_y)
+            return
+        topology = app_state.topology
+        if topology is not self._topology:
+            self._refresh_tables(topology)
+        analog = self.analog
+        if analog is not None:
+            # Output happens on the stick scheduler's clock, not per report
+            analog.update(raw_x, raw_y)
+            return
 
         # Digitalize to keys per requested mapping (8-direction quantization)
-        target_keys: Set[object] = set()
-        single_mode = is_single_controller_mode()
-        single_which = which_single_controller() if single_mode else None
-
-        # Compute 8-direction sector if outside deadzone
-        deadzone = 0.15
-        r = math.hypot(x, y)
-        sector = None
-        if r >= deadzone:
-            # Angle: 0=Right, 90=Up, 180=Left, 270=Down (y negative is up in our stick space)
-            angle = (math.degrees(math.atan2(-y, x)) + 360.0) % 360.0
-            sector = int((angle + 22.5) // 45) % 8  # 0..7 centered sectors
-
-        def add_dir(dir_code: str) -> None:
+        code = self.stick_state.sector(raw_x, raw_y)
+        if code != self._stick_code:
+            self._stick_code = code
+            target_keys = self._stick_table[code]
             if self.is_left:
-                if single_mode and single_which == "left":
-                    # Left-only: custom mapping: W=RIGHT, A=UP, S=LEFT, D=DOWN
-                    mapping = {"U": "D", "D": "A", "L": "s", "R": "w"}
-                else:
-                    # Dual-mode: Left stick → WASD, with W/S swapped per your request
-                    mapping = {"U": "s", "D": "w", "L": "a", "R": "d"}
+                self._held_left_stick_keys = update_stick_keys("left", target_keys, self._held_left_stick_keys)
             else:
-                if single_mode and single_which == "right":
-                    # Right-only: W A S D = LEFT, DOWN, RIGHT, UP respectively
-                    # Swap A and D as requested
-                    mapping = {"L": "w", "D": "d", "R": "s", "U": "a"}
-                else:
-                    # Dual-mode: Right stick → TFGH with T/G swapped per your request
-                    mapping = {"U": "g", "D": "t", "L": "f", "R": "h"}
-            key = mapping.get(dir_code)
-            if key:
-                target_keys.add(key)
-
-        if self.is_left:
-            if sector is not None:
-                if sector in (0, 7):
-                    add_dir("R")
-                if sector in (1,):
-                    add_dir("U"); add_dir("R")
-                if sector in (2,):
-                    add_dir("U")
-                if sector in (3,):
-                    add_dir("U"); add_dir("L")
-                if sector in (4,):
-                    add_dir("L")
-                if sector in (5,):
-                    add_dir("D"); add_dir("L")
-                if sector in (6,):
-                    add_dir("D")
-                if sector in (7,):
-                    add_dir("D"); add_dir("R")
-            self._held_left_stick_keys = update_stick_keys("left", target_keys, self._held_left_stick_keys)
-        else:
-            if sector is not None:
-                if sector in (0, 7):
-                    add_dir("R")
-                if sector in (1,):
-                    add_dir("U"); add_dir("R")
-                if sector in (2,):
-                    add_dir("U")
-                if sector in (3,):
-                    add_dir("U"); add_dir("L")
-                if sector in (4,):
-                    add_dir("L")
-                if sector in (5,):
-                    add_dir("D"); add_dir("L")
-                if sector in (6,):
-                    add_dir("D")
-                if sector in (7,):
-                    add_dir("D"); add_dir("R")
-            self._held_right_stick_keys = update_stick_keys("right", target_keys, self._held_right_stick_keys)
-
-        # For potential mouse usage by another layer, return scaled deltas
-        sensitivity = 4
-        move_x = -int(max(-1.0, min(1.0, x * 1.7)) * sensitivity)
-        move_y = int(max(-1.0, min(1.0, y * 1.7)) * sensitivity)
-        return move_x, move_y
\ No newline at end of file
+                self._held_right_stick_keys = update_stick_keys("right", target_keys, self._held_right_stick_keys)
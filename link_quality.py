@@ -0,0 +1,105 @@
+"""Per-controller link quality from the sequence fields of the input reports.
+
+Each common input report starts with a 24-bit packet counter (read with
+report_decoder.read_packet_id) and carries the IMU sample timestamp (µs) at
+0x2A, see motion-parser.lua.
+
+``LinkQuality.accept`` looks at those raw bytes before anything is decoded,
+so duplicated or reordered notifications are dropped before they can replay
+an old button state as phantom presses and releases.
+"""
+from __future__ import annotations
+
+import struct
+
+from report_decoder import (
+    PACKET_ID_MODULUS,
+    REPORT_IMU_TIMESTAMP_OFFSET,
+    REPORT_MIN_LENGTH,
+    REPORT_MOTION_LENGTH,
+    read_packet_id,
+)
+
+# A jump of more than this many reports either way is a restarted counter
+# (reconnect, controller reset), not loss or reordering: start over from it
+RESYNC_REPORTS = 256
+
+_IMU_TIMESTAMP = struct.Struct("<I")
+
+
+class LinkQuality:
+    """Counts dropped, duplicated and stale reports for one controller. Runtime loop only."""
+
+    __slots__ = ("received", "accepted", "dropped", "duplicates", "stale", "resyncs", "imu_repeats",
+                 "step", "_last", "_last_imu")
+
+    def __init__(self) -> None:
+        self.received = 0
+        self.accepted = 0
+        # Reports missing between two accepted ones, estimated from the counter gap
+        self.dropped = 0
+        self.duplicates = 0
+        # Older than the last accepted report, i.e. delivered out of order
+        self.stale = 0
+        self.resyncs = 0
+        # New report carrying the same IMU sample as the previous one
+        self.imu_repeats = 0
+        # Counter increment between consecutive reports, learned as the smallest gap seen
+        self.step = 0
+        self._last = -1
+        self._last_imu = -1
+
+    def accept(self, data) -> bool:
+        """True if ``data`` is newer than the last accepted report and should be mapped."""
+        self.received += 1
+        if len(data) < REPORT_MIN_LENGTH:
+            # Too short to carry a counter; the decoder ignores it anyway
+            return True
+        seq = read_packet_id(data)
+        last = self._last
+        if last >= 0:
+            delta = (seq - last) % PACKET_ID_MODULUS
+            if delta == 0:
+                self.duplicates += 1
+                return False
+            step = self.step
+            window = step * RESYNC_REPORTS
+            if delta >= PACKET_ID_MODULUS // 2:
+                # Behind the last accepted report
+                if not step or PACKET_ID_MODULUS - delta <= window:
+                    self.stale += 1
+                    return False
+                self.resyncs += 1
+            elif step and delta > window:
+                self.resyncs += 1
+            else:
+                if not step or delta < step:
+                    self.step = step = delta
+                if delta > step:
+                    self.dropped += round(delta / step) - 1
+        self._last = seq
+        self.accepted += 1
+        if len(data) >= REPORT_MOTION_LENGTH:
+            imu = _IMU_TIMESTAMP.unpack_from(data, REPORT_IMU_TIMESTAMP_OFFSET)[0]
+            if imu == self._last_imu:
+                self.imu_repeats += 1
+            self._last_imu = imu
+        return True
+
+    def reset(self) -> None:
+        """Forget the last sequence numbers, e.g. after a reconnect restarted them."""
+        self._last = -1
+        self._last_imu = -1
+
+    def stats(self) -> dict:
+        expected = self.accepted + self.dropped
+        return {
+            "received": self.received,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "duplicates": self.duplicates,
+            "stale": self.stale,
+            "resyncs": self.resyncs,
+            "imu_repeats": self.imu_repeats,
+            "loss_pct": self.dropped / expected * 100 if expected else 0.0,
+        }
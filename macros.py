@@ -0,0 +1,367 @@
+"""Macro layer on top of the button mapping: turbo, chords, tap-vs-hold, sequences.
+
+Macros are declared in ``settings["macros"]``, for example::
+
+    [
+      {"type": "turbo", "side": "right", "button": "A", "key": "l", "hz": 15},
+      {"type": "chord", "buttons": [["left", "ZL"], ["right", "ZR"]], "key": "space"},
+      {"type": "tap_hold", "side": "left", "button": "L", "tap": "2", "hold": "shift"},
+      {"type": "sequence", "side": "right", "button": "HOME", "steps": [["a", 0.05], ["b", 0.05]]}
+    ]
+
+A button bound to a macro is taken out of the plain mapping: JoyCon hands its
+edges to the engine instead. All timing runs on one TimerWheel on the runtime
+loop, so many active macros don't mean many sleeping tasks.
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from input_mapper import press_key, release_key
+from mapping import MASKS, ProfileError, parse_key
+from timer_wheel import Timer, TimerWheel
+
+# (side, button bit)
+Member = Tuple[str, int]
+
+# Taps are released after this long; zero-length taps get lost by some apps
+TAP_DURATION = 0.02
+
+
+class MacroError(ValueError):
+    pass
+
+
+class Macro:
+    """Receives the edges of the buttons it is bound to."""
+
+    members: Tuple[Member, ...] = ()
+
+    def __init__(self, engine: "MacroEngine") -> None:
+        self.engine = engine
+
+    def on_button(self, member: Member, down: bool, fallback: object) -> None:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """Cancel timers and release anything this macro holds."""
+        raise NotImplementedError
+
+
+class Turbo(Macro):
+    """Repeats ``key`` at ``hz`` while the button is held."""
+
+    def __init__(self, engine: "MacroEngine", member: Member, key: object, hz: float) -> None:
+        super().__init__(engine)
+        self.members = (member,)
+        self.key = key
+        self.half_period = 0.5 / hz
+        self._timer: Optional[Timer] = None
+        self._pressed = False
+
+    def on_button(self, member: Member, down: bool, fallback: object) -> None:
+        if down:
+            if self._timer is None:
+                self._press()
+        else:
+            self.reset()
+
+    def _press(self) -> None:
+        self.engine.press(self.key)
+        self._pressed = True
+        self._timer = self.engine.wheel.schedule(self.half_period, self._release)
+
+    def _release(self) -> None:
+        self.engine.release(self.key)
+        self._pressed = False
+        self._timer = self.engine.wheel.schedule(self.half_period, self._press)
+
+    def reset(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pressed:
+            self.engine.release(self.key)
+            self._pressed = False
+
+
+class TapHold(Macro):
+    """Quick press taps ``tap``; holding past ``hold_time`` holds ``hold`` instead."""
+
+    def __init__(self, engine: "MacroEngine", member: Member, tap: object, hold: object, hold_time: float) -> None:
+        super().__init__(engine)
+        self.members = (member,)
+        self.tap = tap
+        self.hold = hold
+        self.hold_time = hold_time
+        self._timer: Optional[Timer] = None
+        self._holding = False
+
+    def on_button(self, member: Member, down: bool, fallback: object) -> None:
+        if down:
+            if self._timer is None and not self._holding:
+                self._timer = self.engine.wheel.schedule(self.hold_time, self._start_hold)
+        elif self._holding:
+            self.engine.release(self.hold)
+            self._holding = False
+        elif self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self.engine.tap(self.tap)
+
+    def _start_hold(self) -> None:
+        self._timer = None
+        self._holding = True
+        self.engine.press(self.hold)
+
+    def reset(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._holding:
+            self.engine.release(self.hold)
+            self._holding = False
+
+
+class Sequence(Macro):
+    """Plays ``steps`` of (key, hold seconds) once per press, ``gap`` apart."""
+
+    def __init__(self, engine: "MacroEngine", member: Member, steps: Tuple[Tuple[object, float], ...],
+                 gap: float) -> None:
+        super().__init__(engine)
+        self.members = (member,)
+        self.steps = steps
+        self.gap = gap
+        self._timer: Optional[Timer] = None
+        self._index = -1  # step currently held, -1 = idle
+        self._pressed = False
+
+    def on_button(self, member: Member, down: bool, fallback: object) -> None:
+        # A press while it is still playing is ignored; the sequence always finishes
+        if down and self._index < 0:
+            self._index = 0
+            self._step()
+
+    def _step(self) -> None:
+        key, hold = self.steps[self._index]
+        self.engine.press(key)
+        self._pressed = True
+        self._timer = self.engine.wheel.schedule(hold, self._end_step)
+
+    def _end_step(self) -> None:
+        self.engine.release(self.steps[self._index][0])
+        self._pressed = False
+        self._index += 1
+        if self._index < len(self.steps):
+            self._timer = self.engine.wheel.schedule(self.gap, self._step)
+        else:
+            self._index = -1
+            self._timer = None
+
+    def reset(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pressed:
+            self.engine.release(self.steps[self._index][0])
+            self._pressed = False
+        self._index = -1
+
+
+class Chord(Macro):
+    """All ``members`` pressed within ``window`` of each other send ``key`` instead.
+
+    A member pressed alone falls back to its normal key once the window has
+    passed (or immediately on release, as a tap), so the buttons keep working
+    on their own.
+    """
+
+    def __init__(self, engine: "MacroEngine", members: Tuple[Member, ...], key: object, window: float) -> None:
+        super().__init__(engine)
+        self.members = members
+        self.key = key
+        self.window = window
+        self._down: Dict[Member, object] = {}  # member -> fallback key
+        self._fallen_back: Dict[Member, object] = {}
+        self._timer: Optional[Timer] = None
+        self._active = False
+
+    def on_button(self, member: Member, down: bool, fallback: object) -> None:
+        if down:
+            self._down[member] = fallback
+            if self._active:
+                return
+            if len(self._down) == len(self.members) and not self._fallen_back:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._active = True
+                self.engine.press(self.key)
+            elif self._timer is None:
+                if self._fallen_back:
+                    self._fall_back(member)
+                else:
+                    self._timer = self.engine.wheel.schedule(self.window, self._window_expired)
+            return
+
+        self._down.pop(member, None)
+        if self._active:
+            # Chord ends with the first member released; the rest are ignored until up
+            if len(self._down) == len(self.members) - 1:
+                self.engine.release(self.key)
+            if not self._down:
+                self._active = False
+            return
+        key = self._fallen_back.pop(member, None)
+        if key is not None:
+            self.engine.release(key)
+        elif fallback is not None:
+            # Released inside the window: still a normal tap of that button
+            self.engine.tap(fallback)
+        if not self._down and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _window_expired(self) -> None:
+        self._timer = None
+        for member in list(self._down):
+            self._fall_back(member)
+
+    def _fall_back(self, member: Member) -> None:
+        key = self._down.get(member)
+        if key is not None and member not in self._fallen_back:
+            self._fallen_back[member] = key
+            self.engine.press(key)
+
+    def reset(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._active and len(self._down) == len(self.members):
+            self.engine.release(self.key)
+        for key in self._fallen_back.values():
+            self.engine.release(key)
+        self._fallen_back.clear()
+        self._down.clear()
+        self._active = False
+
+
+class MacroEngine:
+    """Routes claimed button edges to macros. Lives on the runtime loop."""
+
+    def __init__(self, wheel: TimerWheel, press: Callable[[object], None] = press_key,
+                 release: Callable[[object], None] = release_key) -> None:
+        self.wheel = wheel
+        self.press = press
+        self.release = release
+        self.macros: List[Macro] = []
+        self._bindings: Dict[Member, Macro] = {}
+
+    def tap(self, key: object) -> None:
+        self.press(key)
+        self.wheel.schedule(TAP_DURATION, self.release, key)
+
+    def load(self, macros: List[Macro]) -> None:
+        for macro in self.macros:
+            macro.reset()
+        bindings = {}
+        for macro in macros:
+            for member in macro.members:
+                if member in bindings:
+                    raise MacroError(f"{member[0]} button {member[1]:#x} is bound to two macros")
+                bindings[member] = macro
+        self.macros = list(macros)
+        self._bindings = bindings
+
+    def claimed_bits(self, side: str) -> int:
+        bits = 0
+        for member_side, bit in self._bindings:
+            if member_side == side:
+                bits |= bit
+        return bits
+
+    def on_button(self, side: str, bit: int, down: bool, fallback: object) -> None:
+        macro = self._bindings.get((side, bit))
+        if macro is not None:
+            macro.on_button((side, bit), down, fallback)
+
+
+def _member(side: object, button: object) -> Member:
+    if side not in MASKS:
+        raise MacroError(f"side must be left or right, got {side!r}")
+    if button not in MASKS[side]:
+        raise MacroError(f"no {button!r} button on the {side} Joy-Con")
+    return side, MASKS[side][button]
+
+
+def _seconds(spec: dict, name: str, default: float) -> float:
+    value = spec.get(name, default)
+    if not isinstance(value, (int, float)) or value <= 0:
+        raise MacroError(f"{name} must be a positive number, got {value!r}")
+    return float(value)
+
+
+def _key(value: object) -> object:
+    try:
+        key = parse_key(value)
+    except ProfileError as e:
+        raise MacroError(str(e)) from None
+    if key is None:
+        raise MacroError("a macro key can't be null")
+    return key
+
+
+def parse_macros(raw: object, engine: MacroEngine) -> List[Macro]:
+    """Validate the ``macros`` setting and build the macros for ``engine``."""
+    if raw is None:
+        return []
+    if not isinstance(raw, list):
+        raise MacroError("macros must be a list")
+    macros: List[Macro] = []
+    for index, spec in enumerate(raw):
+        try:
+            if not isinstance(spec, dict):
+                raise MacroError("each macro must be an object")
+            kind = spec.get("type")
+            if kind == "turbo":
+                macros.append(Turbo(engine, _member(spec.get("side"), spec.get("button")),
+                                    _key(spec.get("key")), _seconds(spec, "hz", 15.0)))
+            elif kind == "tap_hold":
+                macros.append(TapHold(engine, _member(spec.get("side"), spec.get("button")),
+                                      _key(spec.get("tap")), _key(spec.get("hold")),
+                                      _seconds(spec, "hold_time", 0.2)))
+            elif kind == "sequence":
+                steps = spec.get("steps")
+                if not isinstance(steps, list) or not steps:
+                    raise MacroError("steps must be a non-empty list of [key, seconds]")
+                parsed = []
+                for step in steps:
+                    if not isinstance(step, list) or len(step) != 2:
+                        raise MacroError("each step must be [key, seconds]")
+                    parsed.append((_key(step[0]), _seconds({"hold": step[1]}, "hold", 0.05)))
+                macros.append(Sequence(engine, _member(spec.get("side"), spec.get("button")),
+                                       tuple(parsed), _seconds(spec, "gap", 0.03)))
+            elif kind == "chord":
+                buttons = spec.get("buttons")
+                if not isinstance(buttons, list) or len(buttons) < 2:
+                    raise MacroError("a chord needs at least two [side, button] pairs")
+                members = tuple(_member(*pair) if isinstance(pair, list) and len(pair) == 2
+                                else _member(None, None) for pair in buttons)
+                macros.append(Chord(engine, members, _key(spec.get("key")), _seconds(spec, "window", 0.05)))
+            else:
+                raise MacroError(f"unknown macro type {kind!r}")
+        except MacroError as e:
+            raise MacroError(f"macro {index}: {e}") from None
+    return macros
+
+
+_engine: Optional[MacroEngine] = None
+
+
+def get_macros() -> MacroEngine:
+    """Process-wide engine on the runtime loop, shared so chords can span both Joy-Cons."""
+    global _engine
+    if _engine is None:
+        from runtime import get_runtime
+        _engine = MacroEngine(TimerWheel().attach(get_runtime().loop))
+    return _engine
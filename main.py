@@ -1,257 +1,97 @@
-import asyncio
+from startup_profile import profiler
 import queue
-from threading import Thread
-import tkinter as tk
 import sys
-from pystray import Icon, MenuItem, Menu
-from PIL import Image, ImageTk
-from player import Player
-from user_preferences import settings, save_settings, load_settings
-from utils import *
-from bleak import BleakScanner, BleakClient
-from app_state import unregister_controller, register_controller
+with profiler.phase("import tkinter"):
+    import tkinter as tk
+with profiler.phase("import player/mapping"):
+    from player import Player
+from user_preferences import settings, save_settings, flush_settings
+with profiler.phase("import utils"):
+    from utils import *
+with profiler.phase("import supervisor"):
+    from supervisor import get_supervisor
 
 
-used_addresses = set()
 command_queue = queue.Queue()
 
-players : list[Player] = []
 
+def _on_new_device(address: str, player: Player) -> None:
+    # Called from the runtime thread; the type window is opened by the Tk loop
+    command_queue.put({"command": "new_joy_window", "data": address, "player": player})
 
-async def scan_device(prompt="controller"):
-    print(f"\n🔍 Searching for your {prompt} (press sync)...")
-    found_devices = []
-    device_event = asyncio.Event()
 
-    def callback(device, adv):
-        if device.address in used_addresses:
-            return
-        data = adv.manufacturer_data.get(JOYCON_MANUFACTURER_ID)
-        if data and data.startswith(JOYCON_MANUFACTURER_PREFIX):
-            if not any(d.address == device.address for d in found_devices):
-                found_devices.append(device)
-                print(f"  Found {device.name or 'Unknown'} ({device.address})")
-                device_event.set()
+# All BLE work runs on one runtime thread owned by the supervisor
+with profiler.phase("start BLE runtime"):
+    supervisor = get_supervisor(_on_new_device)
 
-    scanner = BleakScanner(callback)
-    await scanner.start()
 
-    selected_device = None
-    try:
-        while True:
-            await device_event.wait()
-            device_event.clear()
-            if found_devices:
-                selected_device = found_devices[0]
-                break
-    finally:
-        await scanner.stop()
-
-    if selected_device:
-        print(f"🎮 Selected {selected_device.name or 'Unknown'} ({selected_device.address})")
-    else:
-        print("❌ No device found.")
-
-    return selected_device
-
-
-
-async def write_command(client, command_id, subcommand_id, buffer):
-    # Pad buffer to 8 bytes minimum because some buffer lengths seems to crash
-    buffer = buffer.ljust(8, b'\0')
-    await client.write_gatt_char(WRITE_COMMAND_UUID, command_id.to_bytes() + b"\x91\x01" + subcommand_id.to_bytes() + b"\x00" + len(buffer).to_bytes() + b"\x00\x00" + buffer)
-
-async def play_vibration_preset(client, preset_id):
-    await write_command(client, COMMAND_VIBRATION, SUBCOMMAND_PLAY_VIBRATION_PRESET, preset_id.to_bytes())
-
-
-async def set_leds(client, player_number):
-    #Repoduce switch led patterns for up to 8 players https://en-americas-support.nintendo.com/app/answers/detail/a_id/22424
-    led_pattern_by_played_id = {
-        1: b'\x01',
-        2: b'\x03',
-        3: b'\x07',
-        4: b'\x0F',
-        5: b'\x09',
-        6: b'\x05',
-        7: b'\x0D',
-        8: b'\x06',
-    }
-
-    if player_number > 8:
-        player_number = 8
+# Keys that change how connected controllers behave
+_CONTROLLER_SETTINGS = {"devices", "macros", "mouse_mode", "mouse_sensitivity", "mouse_output_hz", "gyro_aim", "gyro_sensitivity", "haptic_combos",
+                        "stick_output", "stick_curve", "stick_speed", "stick_pwm_period", "stick_output_hz",
+                        "stick_hysteresis", "stick_radial_hysteresis", "stick_min_hold"}
 
-    print(led_pattern_by_played_id[player_number])
 
-    await write_command(client, COMMAND_LEDS, SUBCOMMAND_SET_PLAYER_LEDS, led_pattern_by_played_id[player_number])
-
-async def connect_and_setup(device, player: Player, handler_func, *handler_args):
-    client = BleakClient(device.address)
-    await client.connect()
-    client._device = device
-    await asyncio.sleep(0.5)  # Allow connection to stabilize
-    await set_leds(client, player.number)
-    await asyncio.sleep(0.5)  # Allow vibration to play
-    await play_vibration_preset(client, 0x04)  # Play default vibration preset
-    await asyncio.sleep(0.5)  # Allow vib
-    if device.address not in settings["devices"]:
-        command_queue.put({"command": "new_joy_window", "data": device.address, "player": player})
-    else:
-        print("hmmmmm???")
-        print(device.address)
-        print(settings["devices"][device.address]["type"])
-        player.attach_joycon(settings["devices"][device.address]["type"])
-    # Track connected side for single/dual logic
-    if player.side:
-        register_controller(player.side)
-    global cliente
-    cliente = client
-    print(cliente)
-    print("cheguei aqui")
-    await handler_func(client, player, *handler_args)
-    player.clients.append(client)
-    print(f"✅ Connected to {device.address}")
-    return client
-
-async def maintain_connection_loop(client, device, player, handler_func, *handler_args):
-    while True:
-        try:
-            if not client.is_connected:
-                # Mark this side as currently unavailable for single/dual mapping
-                try:
-                    if player.side:
-                        unregister_controller(player.side)
-                except Exception:
-                    pass
-                await client.connect()
-                await handler_func(client, player, *handler_args)
-                try:
-                    if player.side:
-                        register_controller(player.side)
-                except Exception:
-                    pass
-                print(f"🔄 Reconnected to {device.address}")
-            await asyncio.sleep(1)
-        except Exception as e:
-            print(f"⚠️ Connection lost or error: {e}")
-            if client.is_connected:
-                await client.disconnect()
-            try:
-                if player.side:
-                    unregister_controller(player.side)
-            except Exception:
-                pass
-            await asyncio.sleep(5)
-
-async def handle_single_joycon(client, player: Player, upright: bool):
-    from solo_logic import handle_single_notification
-    async def cb(sender, data):
-        await handle_single_notification(sender, data, player.side == "LEFT", player.gamepad, upright)
-    await client.start_notify(INPUT_REPORT_UUID, cb)
-
-async def setup_player(number):
-    print(f"\n🎮 Setting up Player {number}")
-    while True:
-        # side = input("Left or Right Joy-Con? (L/R): ").strip().upper()
-        # side = "LEFT" if side == "L" else "RIGHT"
-        # side = "RIGHT"
-        # orientation = input("Orientation? (U=Upright, S=Sideways): ").strip().upper()
-        upright = orientation = "U"
-
-        device = await scan_device(f"Player {number} Joy-Con")
-        if not device:
-            return None
-        used_addresses.add(device.address)
-
-        player = Player(number, "SINGLE_JOYCON")
-        client = await connect_and_setup(device, player, handle_single_joycon, upright)
-        task = asyncio.create_task(maintain_connection_loop(client, device, player, handle_single_joycon, upright))
-        player.task = task
-        return player
-
-
-async def add_player(number):
-    global players
-    player = await setup_player(number)
-    if not player:
-        print("❌ Setup failed. Exiting.")
-        return False
-    players.append(player)
-    return number
-
-async def remove_player(player):
-    print("hmmm")
-    player -= 1
-    global players
-    await players[player].disconnect()
-    print("testre")
-    # await players[player].clients[0].disconnect()
-    # del players[player]
-    # print(f"❌ Player {player.number} removed.")
-
-async def emit_sound():
-    global players
-    for player in players:
-        for client in player.clients:
-            await play_vibration_preset(client, 0x04) 
+def _on_settings_changed(changed):
+    if changed & _CONTROLLER_SETTINGS:
+        supervisor.submit("apply_settings")
 
 
+settings.subscribe(_on_settings_changed)
 
 
 # Função chamada quando clicar em "Quit"
 def quit_action(icon, item):
     icon.stop()
 
-def start_background_loop(loop: asyncio.AbstractEventLoop) -> None:
-    asyncio.set_event_loop(loop)
-    loop.run_forever()
-
 def tray_connect_new_controller():
-    loop = asyncio.new_event_loop()
-    t = Thread(target=start_background_loop, args=(loop,), daemon=True)
-    t.start()
-    asyncio.run_coroutine_threadsafe(add_player(1), loop)
+    supervisor.submit("pair")
 
 
 def _request_bluetooth_permission_early():
     """Kick off a short BLE scan to trigger the system Bluetooth permission prompt early."""
-    async def do_probe():
-        try:
-            scanner = BleakScanner()
-            await scanner.start()
-            await asyncio.sleep(1.0)
-        except Exception:
-            pass
-        finally:
-            try:
-                await scanner.stop()
-            except Exception:
-                pass
-
-    loop = asyncio.new_event_loop()
-    t = Thread(target=start_background_loop, args=(loop,), daemon=True)
-    t.start()
-    asyncio.run_coroutine_threadsafe(do_probe(), loop)
-    # future.add_done_callback(lambda f: self.handle_pairing_result(f.result()))
+    supervisor.submit("probe_bluetooth")
+
+def tray_mouse_mode_checked(item):
+    return settings.get("mouse_mode", False)
+
+def tray_toggle_mouse_mode(icon, item):
+    settings["mouse_mode"] = not settings.get("mouse_mode", False)
+    save_settings(settings)
+
+def tray_gyro_aim_checked(item):
+    return settings.get("gyro_aim", False)
+
+def tray_toggle_gyro_aim(icon, item):
+    settings["gyro_aim"] = not settings.get("gyro_aim", False)
+    save_settings(settings)
+
+def tray_calibrate_sticks():
+    supervisor.submit("calibrate")
 
 def tray_emit_sound():
-    loop = asyncio.new_event_loop()
-    t = Thread(target=start_background_loop, args=(loop,), daemon=True)
-    t.start()
-    asyncio.run_coroutine_threadsafe(emit_sound(), loop)
+    supervisor.submit("emit_sound")
 
 def on_quit(icon, item):
     import os
+    # os._exit skips atexit, so write any debounced settings change first
+    flush_settings()
     os._exit(0)
 
 # Cria o ícone
 def create_icon(tk_main_process):
+    with profiler.phase("import pystray/PIL"):
+        from pystray import Icon, MenuItem, Menu
+        from PIL import Image
+    with profiler.phase("read settings"):
+        start_with_sync = settings["start_with_sync"]
     # Icon
-    settings = load_settings()
     image = Image.open(resource_path("assets/joycon2mouse.png"))
 
     # Main features
     sync_new_controller = MenuItem('Sync new Controller', tray_connect_new_controller)
+    mouse_mode = MenuItem('Optical Mouse Mode', tray_toggle_mouse_mode, checked=tray_mouse_mode_checked)
+    gyro_aim = MenuItem('Gyro Aim', tray_toggle_gyro_aim, checked=tray_gyro_aim_checked)
+    calibrate_sticks = MenuItem('Calibrate Sticks', tray_calibrate_sticks)
 
     # Debug Menu
     debug_emit_sound = MenuItem('Play Sound', tray_emit_sound)
@@ -262,17 +102,22 @@ def create_icon(tk_main_process):
 
     # Final Menu
     menu = Menu(sync_new_controller, 
+                mouse_mode,
+                gyro_aim,
+                calibrate_sticks,
                 debug_menu, 
                 MenuItem('Exit', on_quit))
-    if settings["start_with_sync"]:
+    if start_with_sync:
         tray_connect_new_controller()
+    else:
+        # Saved controllers reconnect on their own; pairing new ones stays a menu action
+        supervisor.submit("connect_known")
     # set_joycon_type_interface("lala")
     return Icon("joycon2mouse", image, menu=menu)
 
 
 def show_onboarding_if_needed(root: tk.Tk):
-    prefs = load_settings()
-    if prefs.get("onboarding_complete"):
+    if settings.get("onboarding_complete"):
         return
 
     win = tk.Toplevel(root)
@@ -293,6 +138,7 @@ def show_onboarding_if_needed(root: tk.Tk):
 
     # Logo
     try:
+        from PIL import Image, ImageTk
         logo_img = Image.open(resource_path("assets/appicon.png")).resize((96, 96))
         logo = ImageTk.PhotoImage(logo_img)
         logo_label = tk.Label(frame, image=logo)
@@ -326,13 +172,13 @@ def show_onboarding_if_needed(root: tk.Tk):
 
     def start_sync():
         tray_connect_new_controller()
-        prefs["onboarding_complete"] = True
-        save_settings(prefs)
+        settings["onboarding_complete"] = True
+        save_settings(settings)
         win.destroy()
 
     def dismiss():
-        prefs["onboarding_complete"] = True
-        save_settings(prefs)
+        settings["onboarding_complete"] = True
+        save_settings(settings)
         win.destroy()
 
     # If the user closes the onboarding window, mark as complete so it doesn't reappear
@@ -343,7 +189,8 @@ def show_onboarding_if_needed(root: tk.Tk):
 
 
 # Hide the main tkinter window on startup
-tk_main_process = tk.Tk()
+with profiler.phase("create Tk root"):
+    tk_main_process = tk.Tk()
 # Hide the main tkinter window on startup
 tk_main_process.withdraw()
 # tk_main_process.wm_attributes("-toolwindow", True)
@@ -361,7 +208,7 @@ def set_joycon_type_interface(controller_id, player: Player):
             settings["devices"][controller_id] = {
                 "type": option
             }
-            player.attach_joycon(option)
+            supervisor.submit("attach_side", player, option)
         else:
             settings["devices"][controller_id]["type"] = option
 
@@ -419,8 +266,15 @@ def process_queue(root):
 
 if __name__ == "__main__":
     try:
-        icon = create_icon(tk_main_process)
-        icon.run_detached()
+        with profiler.phase("create tray icon"):
+            icon = create_icon(tk_main_process)
+            icon.run_detached()
+        profiler.report("tray icon ready")
+        # Pick up hand edits to settings.json (e.g. mapping profiles) without a restart
+        settings.start_watching()
+        # Local /metrics endpoint when JOYCON2MOUSE_METRICS is set
+        from metrics import start_metrics_server
+        start_metrics_server()
         # Trigger macOS Bluetooth permission prompt immediately on first launch
         _request_bluetooth_permission_early()
         show_onboarding_if_needed(tk_main_process)
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+from pynput.keyboard import Key
+from stick_quantizer import SECTOR_DIRECTIONS
+
+MASKS = {
+    "right": {
+        "A":    0x000800,
+        "B":    0x000400,
+        "X":    0x000200,
+        "Y":    0x000100,
+        "PLUS": 0x000002,
+        "STICK":0x000004,
+        "SL":  0x002000,
+        "SR":  0x001000,
+        "R":  0x004000,
+        "ZR":  0x008000,
+        "HOME": 0x000010,
+        "CHAT": 0x000040,
+    },
+    "left": {
+        "UP":     0x000002,
+        "DOWN":   0x000001,
+        "LEFT":   0x000008,
+        "RIGHT":  0x000004,
+        "MINUS":  0x000100,
+        "STICK":  0x000800,
+        "SHARE":  0x002000,
+        "SL":  0x000020,
+        "SR":  0x000010,
+        "L": 0x000040,
+        "ZL": 0x000080
+    }
+}
+
+# Base mapping for LEFT Joy-Con
+LEFT_BUTTON_KEYS: Dict[str, object] = {
+    "UP": Key.up,
+    "DOWN": Key.down,
+    "LEFT": Key.left,
+    "RIGHT": Key.right,
+    "ZL": "1",
+    "L": "2",
+    "SL": "3",
+    "SR": "4",
+    "MINUS": "5",
+    "SHARE": "z",
+}
+
+# Single-mode override for D-Pad mapping
+LEFT_SINGLE_BUTTON_KEYS: Dict[str, object] = {
+    # Arrow outputs remapped: UP/DOWN/LEFT/RIGHT = DPAD RIGHT/LEFT/UP/DOWN
+    "RIGHT": Key.up,
+    "LEFT": Key.down,
+    "UP": Key.left,
+    "DOWN": Key.right,
+}
+
+# Base mapping for RIGHT Joy-Con
+RIGHT_BUTTON_KEYS: Dict[str, object] = {
+    # Default dual-mode face buttons: I=Y, J=X, K=B, L=A
+    "X": "i",
+    "Y": "j",
+    "B": "k",
+    "A": "l",
+    "R": "9",
+    "ZR": "0",
+    "SR": "7",
+    "SL": "8",
+    "PLUS": "6",
+    "HOME": "n",
+    "CHAT": "m",
+}
+
+# Single-mode override for face buttons: IJKL = Y B A X
+RIGHT_SINGLE_BUTTON_KEYS: Dict[str, object] = {
+    "Y": "i",
+    "B": "j",
+    "A": "k",
+    "X": "l",
+    # Swap 7 and 8 for right Joy-Con SL/SR in single mode
+    "SR": "8",
+    "SL": "7",
+}
+
+# Stick direction (U/D/L/R) -> key, per stick and controller topology
+# Dual-mode: Left stick -> WASD, with W/S swapped per your request
+LEFT_STICK_KEYS: Dict[str, object] = {"U": "s", "D": "w", "L": "a", "R": "d"}
+# Left-only: custom mapping: W=RIGHT, A=UP, S=LEFT, D=DOWN
+LEFT_SINGLE_STICK_KEYS: Dict[str, object] = {"U": "D", "D": "A", "L": "s", "R": "w"}
+# Dual-mode: Right stick -> TFGH with T/G swapped per your request
+RIGHT_STICK_KEYS: Dict[str, object] = {"U": "g", "D": "t", "L": "f", "R": "h"}
+# Right-only: W A S D = LEFT, DOWN, RIGHT, UP respectively
+# Swap A and D as requested
+RIGHT_SINGLE_STICK_KEYS: Dict[str, object] = {"L": "w", "D": "d", "R": "s", "U": "a"}
+
+# Button combos that play a haptic pattern (see haptics.PATTERNS) on the same Joy-Con
+HAPTIC_COMBOS: Dict[str, Dict[tuple, str]] = {
+    "left": {("L", "ZL"): "pulse"},
+    "right": {("R", "ZR"): "pulse"},
+}
+
+
+# User profiles: per device, per mode, overrides on top of the defaults above
+PROFILE_MODES = ("single-left", "single-right", "dual")
+STICK_DIRECTIONS = ("U", "D", "L", "R")
+
+
+class ProfileError(ValueError):
+    pass
+
+
+class Profile(NamedTuple):
+    """A validated profile. Hashable, so compiled tables can be cached per profile."""
+    # (name, key or None to unmap), sorted by name
+    buttons: Tuple[Tuple[str, object], ...] = ()
+    stick: Tuple[Tuple[str, object], ...] = ()
+
+
+def profile_mode(single_which: str | None) -> str:
+    return f"single-{single_which}" if single_which else "dual"
+
+
+def parse_key(value: object) -> object:
+    """A profile key: one character, or the name of a pynput Key such as "space"."""
+    if value is None:
+        return None
+    if not isinstance(value, str) or not value:
+        raise ProfileError(f"key must be a string, got {value!r}")
+    if len(value) == 1:
+        return value
+    try:
+        return Key[value.lower()]
+    except KeyError:
+        raise ProfileError(f"unknown key {value!r}") from None
+
+
+def parse_profile(raw: object, side: str) -> Profile:
+    """Validate one ``{"buttons": {...}, "stick": {...}}`` profile for ``side``."""
+    if not isinstance(raw, dict):
+        raise ProfileError("profile must be an object")
+    unknown = set(raw) - {"buttons", "stick"}
+    if unknown:
+        raise ProfileError(f"unknown profile section(s): {', '.join(sorted(unknown))}")
+    buttons = raw.get("buttons", {})
+    stick = raw.get("stick", {})
+    if not isinstance(buttons, dict) or not isinstance(stick, dict):
+        raise ProfileError("buttons and stick must be objects")
+    masks = MASKS[side]
+    for name in buttons:
+        if name not in masks:
+            raise ProfileError(f"no {name!r} button on the {side} Joy-Con")
+    for direction in stick:
+        if direction not in STICK_DIRECTIONS:
+            raise ProfileError(f"stick direction must be one of U/D/L/R, got {direction!r}")
+    return Profile(
+        tuple(sorted((name, parse_key(key)) for name, key in buttons.items())),
+        tuple(sorted((direction, parse_key(key)) for direction, key in stick.items())),
+    )
+
+
+def parse_profiles(raw: object, side: str) -> Dict[str, Profile]:
+    """Validate a device's ``profiles`` setting into mode -> Profile."""
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ProfileError("profiles must be an object")
+    profiles = {}
+    for mode, profile in raw.items():
+        if mode not in PROFILE_MODES:
+            raise ProfileError(f"profile mode must be one of {', '.join(PROFILE_MODES)}, got {mode!r}")
+        try:
+            profiles[mode] = parse_profile(profile, side)
+        except ProfileError as e:
+            raise ProfileError(f"{mode}: {e}") from None
+    return profiles
+
+
+def _apply_profile(keys: Dict[str, object], overrides: Tuple[Tuple[str, object], ...]) -> Dict[str, object]:
+    for name, key in overrides:
+        if key is None:
+            keys.pop(name, None)
+        else:
+            keys[name] = key
+    return keys
+
+
+def button_keys(side: str, single_which: str | None, profile: Optional[Profile] = None) -> Dict[str, object]:
+    """Button name -> output key for ``side`` given the current controller topology."""
+    if side == "right":
+        keys = dict(RIGHT_BUTTON_KEYS)
+        if single_which == "right":
+            keys.update(RIGHT_SINGLE_BUTTON_KEYS)
+    else:
+        keys = dict(LEFT_BUTTON_KEYS)
+        if single_which == "left":
+            keys.update(LEFT_SINGLE_BUTTON_KEYS)
+    if profile is not None:
+        _apply_profile(keys, profile.buttons)
+    return keys
+
+
+@lru_cache(maxsize=None)
+def compile_button_table(side: str, single_which: str | None, profile: Optional[Profile] = None) -> Dict[int, object]:
+    """Compile the mapping for ``side`` into a button bit -> key table.
+
+    Only the (side, single/dual, profile) combination matters, so each table
+    is built once per process. Callers must not mutate the result.
+    """
+    masks = MASKS[side]
+    return {masks[name]: key for name, key in button_keys(side, single_which, profile).items()}
+
+
+def stick_keys(side: str, single_which: str | None, profile: Optional[Profile] = None) -> Dict[str, object]:
+    """Stick direction -> output key for ``side`` given the current controller topology."""
+    if side == "right":
+        keys = RIGHT_SINGLE_STICK_KEYS if single_which == "right" else RIGHT_STICK_KEYS
+    else:
+        keys = LEFT_SINGLE_STICK_KEYS if single_which == "left" else LEFT_STICK_KEYS
+    if profile is not None:
+        keys = _apply_profile(dict(keys), profile.stick)
+    return keys
+
+
+@lru_cache(maxsize=None)
+def compile_stick_table(side: str, single_which: str | None, profile: Optional[Profile] = None) -> tuple[frozenset, ...]:
+    """Compile the stick mapping into one frozenset of keys per sector code."""
+    keys = stick_keys(side, single_which, profile)
+    return tuple(
+        frozenset(keys[d] for d in directions if d in keys)
+        for directions in SECTOR_DIRECTIONS
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_haptic_combos(side: str) -> tuple[tuple[int, str], ...]:
+    """Compile the haptic combos for ``side`` into (button mask, pattern) pairs."""
+    side = "right" if side == "right" else "left"
+    masks = MASKS[side]
+    combos = []
+    for buttons, pattern in HAPTIC_COMBOS[side].items():
+        mask = 0
+        for name in buttons:
+            mask |= masks[name]
+        combos.append((mask, pattern))
+    return tuple(combos)
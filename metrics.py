@@ -0,0 +1,215 @@
+"""Low-overhead latency histograms for the notify -> decode -> map -> inject path.
+
+Instrumentation is off unless the app is launched with
+``JOYCON2MOUSE_METRICS=<port>`` (or ``1`` for the default port). When off, the
+plain notification handler is used and nothing here is touched per report.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Dict, Optional
+
+DEFAULT_METRICS_PORT = 9477
+
+# Log-linear buckets in the spirit of HdrHistogram: 32 linear sub-buckets per
+# power of two, so every recorded value is kept to within ~3%.
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+_MAX_SHIFT = 34  # values are clamped at ~2^40 ns (~18 minutes)
+_BUCKET_COUNT = (_MAX_SHIFT + 2) * _SUB_BUCKETS
+
+
+class LatencyHistogram:
+    """Fixed-size histogram of nanosecond durations. One writer thread per instance."""
+
+    __slots__ = ("counts", "total", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * _BUCKET_COUNT
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value_ns: int) -> None:
+        if value_ns < _SUB_BUCKETS:
+            idx = value_ns if value_ns > 0 else 0
+        else:
+            shift = value_ns.bit_length() - _SUB_BUCKET_BITS - 1
+            if shift > _MAX_SHIFT:
+                shift = _MAX_SHIFT
+                value_ns = (1 << (_MAX_SHIFT + _SUB_BUCKET_BITS + 1)) - 1
+            idx = ((shift + 1) << _SUB_BUCKET_BITS) + (value_ns >> shift) - _SUB_BUCKETS
+        self.counts[idx] += 1
+        self.total += 1
+        self.sum += value_ns
+        if value_ns > self.max:
+            self.max = value_ns
+
+    @staticmethod
+    def _bucket_value(idx: int) -> float:
+        # Midpoint of the bucket's value range
+        if idx < _SUB_BUCKETS:
+            return float(idx)
+        shift = (idx >> _SUB_BUCKET_BITS) - 1
+        low = ((idx & (_SUB_BUCKETS - 1)) + _SUB_BUCKETS) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def percentile(self, q: float) -> float:
+        """Value in ns at quantile ``q`` (0..1)."""
+        if not self.total:
+            return 0.0
+        target = max(1, int(q * self.total + 0.5))
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= target:
+                    return min(self._bucket_value(idx), float(self.max))
+        return float(self.max)
+
+    def mean(self) -> float:
+        return self.sum / self.total if self.total else 0.0
+
+
+class ControllerMetrics:
+    """Per-controller latency histograms, one per pipeline stage."""
+
+    STAGES = ("decode", "map", "end_to_end")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.decode = LatencyHistogram()
+        self.map = LatencyHistogram()
+        # notify -> event injected by the output worker (recorded on that thread)
+        self.end_to_end = LatencyHistogram()
+        # disconnect -> notifications re-subscribed, recorded by the supervisor
+        self.reconnect = LatencyHistogram()
+        # The controller's StickState, for its applied/suppressed direction-change counters
+        self.stick = None
+        # The controller's LinkQuality, for dropped/duplicate/stale report counts
+        self.link = None
+
+    def record(self, t_notify: int, t_decoded: int, t_mapped: int) -> None:
+        self.decode.record(t_decoded - t_notify)
+        self.map.record(t_mapped - t_decoded)
+
+    def record_injected(self, t_notify: int, t_injected: int) -> None:
+        self.end_to_end.record(t_injected - t_notify)
+
+    def record_reconnect(self, duration_ns: int) -> None:
+        self.reconnect.record(duration_ns)
+
+    def histograms(self) -> Dict[str, LatencyHistogram]:
+        return {stage: getattr(self, stage) for stage in self.STAGES}
+
+
+_controllers: Dict[str, ControllerMetrics] = {}
+_controllers_lock = threading.Lock()
+
+
+def metrics_port() -> Optional[int]:
+    value = os.environ.get("JOYCON2MOUSE_METRICS", "")
+    if not value or value == "0":
+        return None
+    if value.isdigit() and int(value) > 1:
+        return int(value)
+    return DEFAULT_METRICS_PORT
+
+
+def metrics_enabled() -> bool:
+    return metrics_port() is not None
+
+
+def get_controller_metrics(name: str) -> ControllerMetrics:
+    with _controllers_lock:
+        metrics = _controllers.get(name)
+        if metrics is None:
+            metrics = _controllers[name] = ControllerMetrics(name)
+        return metrics
+
+
+def all_controller_metrics() -> Dict[str, ControllerMetrics]:
+    with _controllers_lock:
+        return dict(_controllers)
+
+
+_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def render_prometheus() -> str:
+    """Current metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP joycon2mouse_latency_us Input pipeline latency per controller and stage",
+        "# TYPE joycon2mouse_latency_us summary",
+    ]
+    for name, controller in sorted(all_controller_metrics().items()):
+        for stage, hist in controller.histograms().items():
+            labels = f'controller="{name}",stage="{stage}"'
+            for q in _QUANTILES:
+                lines.append(f'joycon2mouse_latency_us{{{labels},quantile="{q}"}} {hist.percentile(q) / 1000:.3f}')
+            lines.append(f"joycon2mouse_latency_us_sum{{{labels}}} {hist.sum / 1000:.3f}")
+            lines.append(f"joycon2mouse_latency_us_count{{{labels}}} {hist.total}")
+
+    lines.append("# HELP joycon2mouse_reconnect_seconds Time from disconnect to notifications flowing again")
+    lines.append("# TYPE joycon2mouse_reconnect_seconds summary")
+    for name, controller in sorted(all_controller_metrics().items()):
+        hist = controller.reconnect
+        if not hist.total:
+            continue
+        labels = f'controller="{name}"'
+        for q in _QUANTILES:
+            lines.append(f'joycon2mouse_reconnect_seconds{{{labels},quantile="{q}"}} {hist.percentile(q) / 1e9:.3f}')
+        lines.append(f"joycon2mouse_reconnect_seconds_sum{{{labels}}} {hist.sum / 1e9:.3f}")
+        lines.append(f"joycon2mouse_reconnect_seconds_count{{{labels}}} {hist.total}")
+
+    lines.append("# HELP joycon2mouse_stick_transitions_total Stick direction changes, applied or held back by hysteresis")
+    lines.append("# TYPE joycon2mouse_stick_transitions_total counter")
+    for name, controller in sorted(all_controller_metrics().items()):
+        if controller.stick is None:
+            continue
+        for result, count in controller.stick.stats().items():
+            lines.append(f'joycon2mouse_stick_transitions_total{{controller="{name}",result="{result}"}} {count}')
+
+    lines.append("# HELP joycon2mouse_link_reports_total Input reports by sequence check outcome")
+    lines.append("# TYPE joycon2mouse_link_reports_total counter")
+    link_loss = []
+    for name, controller in sorted(all_controller_metrics().items()):
+        if controller.link is None:
+            continue
+        stats = controller.link.stats()
+        for result in ("accepted", "dropped", "duplicates", "stale", "resyncs", "imu_repeats"):
+            lines.append(f'joycon2mouse_link_reports_total{{controller="{name}",result="{result}"}} {stats[result]}')
+        link_loss.append(f'joycon2mouse_link_loss_pct{{controller="{name}"}} {stats["loss_pct"]:.3f}')
+    lines.append("# HELP joycon2mouse_link_loss_pct Share of reports lost over the air")
+    lines.append("# TYPE joycon2mouse_link_loss_pct gauge")
+    lines.extend(link_loss)
+
+    from output import get_output
+    for key, value in get_output().stats().items():
+        lines.append(f"# TYPE joycon2mouse_output_{key} gauge")
+        lines.append(f"joycon2mouse_output_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[threading.Thread]:
+    """Serve GET /metrics on 127.0.0.1 from a daemon thread. No-op when disabled."""
+    port = port or metrics_port()
+    if port is None:
+        return None
+
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+
+    app = FastAPI(title="JoyCon2Mouse metrics")
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics() -> str:
+        return render_prometheus()
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="metrics-server", daemon=True)
+    thread.start()
+    print(f"📈 Metrics on http://127.0.0.1:{port}/metrics")
+    return thread
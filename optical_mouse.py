@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+DEFAULT_OUTPUT_HZ = 125.0
+# Larger jumps between two reports aren't motion but restarted counters; re-seed instead
+MAX_REPORT_DELTA = 4096
+
+
+def counter_delta(now: int, prev: int) -> int:
+    # Signed difference of two 16-bit wrapping counters
+    return ((now - prev + 0x8000) & 0xFFFF) - 0x8000
+
+
+class OpticalMouse:
+    """Turns the Joy-Con 2 optical sensor counters into relative pointer moves.
+
+    Deltas are scaled and accumulated as floats; only whole pixels are emitted,
+    the sub-pixel remainder carries over to the next move. Moves are emitted
+    at most ``output_hz`` times per second so the OS sees a steady rate no
+    matter how many reports arrive in between.
+    """
+
+    __slots__ = (
+        "scale_x",
+        "scale_y",
+        "interval",
+        "_last_x",
+        "_last_y",
+        "_acc_x",
+        "_acc_y",
+        "_next_emit",
+    )
+
+    def __init__(self, sensitivity: float = 1.0, output_hz: float = DEFAULT_OUTPUT_HZ,
+                 invert_x: bool = False, invert_y: bool = False) -> None:
+        self.scale_x = -sensitivity if invert_x else sensitivity
+        self.scale_y = -sensitivity if invert_y else sensitivity
+        self.interval = 1.0 / output_hz if output_hz > 0 else 0.0
+        self._last_x: Optional[int] = None
+        self._last_y = 0
+        self._acc_x = 0.0
+        self._acc_y = 0.0
+        self._next_emit = 0.0
+
+    def reset(self) -> None:
+        # Next sample only re-seeds the counters, e.g. after a reconnect
+        self._last_x = None
+        self._acc_x = self._acc_y = 0.0
+
+    def update(self, raw_x: int, raw_y: int, now: float) -> Optional[Tuple[int, int]]:
+        """Feed one report's counters; returns a whole-pixel (dx, dy) when due."""
+        if self._last_x is None:
+            self._last_x, self._last_y = raw_x, raw_y
+            return None
+        dx = counter_delta(raw_x, self._last_x)
+        dy = counter_delta(raw_y, self._last_y)
+        self._last_x, self._last_y = raw_x, raw_y
+        if abs(dx) > MAX_REPORT_DELTA or abs(dy) > MAX_REPORT_DELTA:
+            return None
+        if dx:
+            self._acc_x += dx * self.scale_x
+        if dy:
+            self._acc_y += dy * self.scale_y
+        if now < self._next_emit:
+            return None
+        out_x = int(self._acc_x)
+        out_y = int(self._acc_y)
+        if not (out_x or out_y):
+            return None
+        self._acc_x -= out_x
+        self._acc_y -= out_y
+        self._next_emit = now + self.interval
+        return out_x, out_y
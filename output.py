@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+# Event ops queued to the worker: (op, a, b, enqueued_at, tag)
+PRESS = 0
+RELEASE = 1
+MOVE = 2
+
+_STOP = object()
+
+
+class OutputBackend:
+    """Where injected input ends up. Subclasses override all three methods."""
+
+    def press(self, k: object) -> None:
+        raise NotImplementedError
+
+    def release(self, k: object) -> None:
+        raise NotImplementedError
+
+    def move(self, dx: int, dy: int) -> None:
+        raise NotImplementedError
+
+
+class PynputBackend(OutputBackend):
+    """Injects through the pynput controllers in utils (needs Accessibility on macOS)."""
+
+    def __init__(self) -> None:
+        from utils import send_key_press, send_key_release, send_mouse_move
+        self.press = send_key_press
+        self.release = send_key_release
+        self.move = send_mouse_move
+
+
+class NullBackend(OutputBackend):
+    """Discards events but counts them; for benchmarks and machines without a desktop."""
+
+    def __init__(self) -> None:
+        self.presses = 0
+        self.releases = 0
+        self.moves = 0
+
+    def press(self, k: object) -> None:
+        self.presses += 1
+
+    def release(self, k: object) -> None:
+        self.releases += 1
+
+    def move(self, dx: int, dy: int) -> None:
+        self.moves += 1
+
+
+class OutputWorker:
+    """Runs OS input injection on its own thread behind a bounded queue.
+
+    Everything waiting in the queue when the worker wakes up is handled as one
+    batch. Within a batch, mouse deltas between key events are summed into one
+    move, and events that would not change the OS state are dropped: a press of
+    a key that is already down, a release of a key that is up, and a release
+    immediately undone by a press of the same key. A press followed by a
+    release is a real tap and is always kept.
+    """
+
+    def __init__(self, backend: OutputBackend, maxsize: int = 1024) -> None:
+        self.backend = backend
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._held: Set[object] = set()
+        self._thread: Optional[threading.Thread] = None
+        # (ControllerMetrics, t_notify_ns) of the report being mapped right now, set by the
+        # instrumented notification handler; None whenever instrumentation is off
+        self.tag: Optional[tuple] = None
+        # Stats, written only by the worker thread (dropped_moves by producers)
+        self.injected = 0
+        self.coalesced = 0
+        self.dropped_moves = 0
+        self.max_queue_depth = 0
+        self.batches = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._latency_total = 0.0
+
+    def start(self) -> "OutputWorker":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="output-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 1.0) -> None:
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    # Producer side, called from the BLE thread
+
+    def press(self, k: object) -> None:
+        # Key events block rather than drop: a lost release means a stuck key
+        self._queue.put((PRESS, k, None, time.perf_counter(), self.tag))
+
+    def release(self, k: object) -> None:
+        self._queue.put((RELEASE, k, None, time.perf_counter(), self.tag))
+
+    def move(self, dx: int, dy: int) -> None:
+        try:
+            self._queue.put_nowait((MOVE, dx, dy, time.perf_counter(), self.tag))
+        except queue.Full:
+            self.dropped_moves += 1
+
+    def flush(self, timeout: float = 1.0) -> bool:
+        """Wait until everything queued so far has been injected."""
+        done = threading.Event()
+        self._queue.put((None, done, None, 0.0, None))
+        return done.wait(timeout)
+
+    # Worker side
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            try:
+                while True:
+                    batch.append(q.get_nowait())
+            except queue.Empty:
+                pass
+            depth = len(batch)
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+            stop = False
+            if _STOP in batch:
+                batch = batch[:batch.index(_STOP)]
+                stop = True
+            self._apply(self._coalesce(batch))
+            if stop:
+                return
+
+    def _coalesce(self, batch: List[tuple]) -> List[tuple]:
+        out: List[Optional[tuple]] = []
+        held = self._held
+        # Index in out of a release that a later press could cancel
+        pending_release: Dict[object, int] = {}
+        move_dx = move_dy = 0
+        move_t = 0.0
+        move_tag = None
+        for event in batch:
+            op = event[0]
+            if op == MOVE:
+                if not (move_dx or move_dy):
+                    move_t = event[3]
+                    move_tag = event[4]
+                else:
+                    self.coalesced += 1
+                move_dx += event[1]
+                move_dy += event[2]
+                continue
+            if move_dx or move_dy:
+                out.append((MOVE, move_dx, move_dy, move_t, move_tag))
+                move_dx = move_dy = 0
+            k = event[1]
+            if op == PRESS:
+                idx = pending_release.pop(k, None)
+                if idx is not None:
+                    # release + press in the same batch: the key just stays down
+                    out[idx] = None
+                    held.add(k)
+                    self.coalesced += 2
+                elif k in held:
+                    self.coalesced += 1
+                else:
+                    held.add(k)
+                    out.append(event)
+            elif op == RELEASE:
+                if k in held:
+                    held.discard(k)
+                    pending_release[k] = len(out)
+                    out.append(event)
+                else:
+                    self.coalesced += 1
+            else:
+                out.append(event)
+        if move_dx or move_dy:
+            out.append((MOVE, move_dx, move_dy, move_t, move_tag))
+        return [e for e in out if e is not None]
+
+    def _apply(self, events: List[tuple]) -> None:
+        backend = self.backend
+        for op, a, b, enqueued_at, tag in events:
+            try:
+                if op == PRESS:
+                    backend.press(a)
+                elif op == RELEASE:
+                    backend.release(a)
+                elif op == MOVE:
+                    backend.move(a, b)
+                else:
+                    a.set()  # flush marker
+                    continue
+            except Exception:
+                pass
+            if tag is not None:
+                tag[0].record_injected(tag[1], time.perf_counter_ns())
+            latency = time.perf_counter() - enqueued_at
+            self.last_latency = latency
+            if latency > self.max_latency:
+                self.max_latency = latency
+            self._latency_total += latency
+            self.injected += 1
+        self.batches += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "injected": self.injected,
+            "coalesced": self.coalesced,
+            "dropped_moves": self.dropped_moves,
+            "batches": self.batches,
+            "last_latency_ms": self.last_latency * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+            "mean_latency_ms": self._latency_total / self.injected * 1000 if self.injected else 0.0,
+        }
+
+
+_worker: Optional[OutputWorker] = None
+_worker_lock = threading.Lock()
+
+
+def _default_backend() -> OutputBackend:
+    # JOYCON2MOUSE_OUTPUT=null keeps everything off the OS, e.g. on Linux test boxes
+    if os.environ.get("JOYCON2MOUSE_OUTPUT", "").lower() == "null":
+        return NullBackend()
+    return PynputBackend()
+
+
+def configure_output(backend: OutputBackend, maxsize: int = 1024) -> OutputWorker:
+    """Replace the process-wide output worker with one using ``backend``."""
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+        _worker = OutputWorker(backend, maxsize).start()
+        return _worker
+
+
+def get_output() -> OutputWorker:
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = OutputWorker(_default_backend()).start()
+    return _worker
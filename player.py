@@ -1,4 +1,5 @@
 import gc
+from analog_stick import get_stick_scheduler
 from joycon import JoyCon
 from app_state import unregister_controller, register_controller
 
@@ -7,11 +8,13 @@ from app_state import unregister_controller, register_controller
 global cliente
 cliente = None
 class Player:
-    def __init__(self, number, controller_type, side=None, task=None):
+    def __init__(self, number, controller_type, side=None, task=None, address=None):
         self.number = number
+        self.address = address
         self.type = controller_type
         self.side = side
         self.clients = []
+        self.task = task
         # Explicit garbage collection to prevent reuse issues
         gc.collect()
         self.gamepad = None
@@ -28,12 +31,18 @@ class Player:
             pass
     
     async def disconnect(self):
+        if self.gamepad is not None and self.gamepad.analog is not None:
+            get_stick_scheduler().remove(self.gamepad.analog)
         for client in self.clients:
+            channel = getattr(client, "_commands", None)
+            if channel is not None:
+                channel.close()
             if client.is_connected:
                 await client.disconnect()
         self.clients.clear()
         # Explicit garbage collection to prevent reuse issues
-        await self.task.cancel()
+        if self.task is not None:
+            self.task.cancel()
         gc.collect()
         try:
             if self.side:
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import struct
+
+# Layout of the BLE "common" input report (handle 0x000a, see motion-parser.lua
+# parse_wireless_input_reportA). All multi-byte fields are little endian except
+# the button word, which the mapping code has always read big endian.
+REPORT_PACKET_ID_OFFSET = 0x00
+REPORT_BUTTONS_OFFSET = 0x03
+REPORT_STICKS_OFFSET = 0x0A
+REPORT_IMU_TIMESTAMP_OFFSET = 0x2A
+REPORT_MIN_LENGTH = 0x10       # enough for buttons + both sticks
+REPORT_MOUSE_LENGTH = 0x14     # optical mouse X/Y end at 0x13
+REPORT_MOTION_LENGTH = 0x3C    # gyro bytes end at 0x3B
+
+ACCEL_SCALE = 1 / 4096         # 4096 = 1G
+GYRO_SCALE = 360 / 48000       # raw -> degrees per second
+
+# 24-bit packet counter in bytes 0..2; byte 3 is already part of the button word
+_PACKET_ID = struct.Struct("<HB")
+PACKET_ID_MODULUS = 1 << 24
+# Bytes 3..6 read as one big endian word: the right Joy-Con uses bytes 3..5,
+# the left one bytes 4..6.
+_BUTTONS = struct.Struct(">I")
+# 0x0A left stick (3 bytes), 0x0D right stick (3 bytes), 0x10 mouse X, 0x12 mouse Y
+_STICKS_MOUSE = struct.Struct("<HBHBHH")
+_STICKS = struct.Struct("<HBHB")
+# Full body from 0x0A: sticks, mouse, then the motion block at 0x2A
+# (imu timestamp in µs, temperature, accel xyz, gyro xyz).
+_FULL = struct.Struct("<HBHBHH22xIh3h3h")
+
+
+def read_packet_id(data) -> int:
+    """Packet counter of a raw report of at least REPORT_MIN_LENGTH bytes."""
+    low, high = _PACKET_ID.unpack_from(data, REPORT_PACKET_ID_OFFSET)
+    return low | (high << 16)
+
+
+class ReportFrame:
+    """Decoded view of a single input report. Reused across reports."""
+
+    __slots__ = (
+        "packet_id",
+        "buttons_left",
+        "buttons_right",
+        "left_x",
+        "left_y",
+        "right_x",
+        "right_y",
+        "mouse_x",
+        "mouse_y",
+        "imu_timestamp",
+        "temperature",
+        "accel_x",
+        "accel_y",
+        "accel_z",
+        "gyro_x",
+        "gyro_y",
+        "gyro_z",
+        "has_sticks",
+        "has_motion",
+    )
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.packet_id = 0
+        self.buttons_left = 0
+        self.buttons_right = 0
+        self.left_x = 2048
+        self.left_y = 2048
+        self.right_x = 2048
+        self.right_y = 2048
+        self.mouse_x = 0
+        self.mouse_y = 0
+        self.imu_timestamp = 0
+        self.temperature = 0
+        self.accel_x = 0
+        self.accel_y = 0
+        self.accel_z = 0
+        self.gyro_x = 0
+        self.gyro_y = 0
+        self.gyro_z = 0
+        self.has_sticks = False
+        self.has_motion = False
+
+    def accel_g(self) -> tuple[float, float, float]:
+        return self.accel_x * ACCEL_SCALE, self.accel_y * ACCEL_SCALE, self.accel_z * ACCEL_SCALE
+
+    def gyro_dps(self) -> tuple[float, float, float]:
+        return self.gyro_x * GYRO_SCALE, self.gyro_y * GYRO_SCALE, self.gyro_z * GYRO_SCALE
+
+
+def decode_report(data, frame: ReportFrame) -> ReportFrame:
+    """Parse ``data`` (bytes/bytearray/memoryview) into ``frame`` in place.
+
+    Reports too short to hold the sticks leave the stick and motion fields at
+    their previous values and clear ``has_sticks``/``has_motion``.
+    """
+    length = len(data)
+    if length >= REPORT_MOTION_LENGTH:
+        frame.packet_id = read_packet_id(data)
+        buttons = _BUTTONS.unpack_from(data, REPORT_BUTTONS_OFFSET)[0]
+        frame.buttons_right = buttons >> 8
+        frame.buttons_left = buttons & 0xFFFFFF
+        (
+            left_lo, left_hi, right_lo, right_hi, frame.mouse_x, frame.mouse_y,
+            frame.imu_timestamp, frame.temperature,
+            frame.accel_x, frame.accel_y, frame.accel_z,
+            frame.gyro_x, frame.gyro_y, frame.gyro_z,
+        ) = _FULL.unpack_from(data, REPORT_STICKS_OFFSET)
+        frame.has_motion = True
+    elif length >= REPORT_MIN_LENGTH:
+        frame.packet_id = read_packet_id(data)
+        buttons = _BUTTONS.unpack_from(data, REPORT_BUTTONS_OFFSET)[0]
+        frame.buttons_right = buttons >> 8
+        frame.buttons_left = buttons & 0xFFFFFF
+        if length >= REPORT_MOUSE_LENGTH:
+            left_lo, left_hi, right_lo, right_hi, frame.mouse_x, frame.mouse_y = _STICKS_MOUSE.unpack_from(
+                data, REPORT_STICKS_OFFSET
+            )
+        else:
+            # Sticks but no mouse fields: leave mouse_x/mouse_y as they were
+            left_lo, left_hi, right_lo, right_hi = _STICKS.unpack_from(data, REPORT_STICKS_OFFSET)
+        frame.has_motion = False
+    else:
+        frame.has_sticks = False
+        frame.has_motion = False
+        return frame
+
+    # 12-bit packed axes: X = low 12 bits, Y = high 12 bits of the 24-bit field
+    left = left_lo | (left_hi << 16)
+    right = right_lo | (right_hi << 16)
+    frame.left_x = left & 0xFFF
+    frame.left_y = left >> 12
+    frame.right_x = right & 0xFFF
+    frame.right_y = right >> 12
+    frame.has_sticks = True
+    return frame
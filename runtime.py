@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Callable, Coroutine, Optional
+
+
+class Runtime:
+    """One long-lived asyncio loop on a daemon thread.
+
+    Every BLE client, notification callback and background task lives on this
+    loop, so the number of threads and loops stays fixed no matter how often
+    the tray menu is used.
+    """
+
+    def __init__(self, name: str = "ble-runtime") -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._started = threading.Event()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    def start(self) -> "Runtime":
+        if not self._thread.is_alive():
+            self._thread.start()
+            self._started.wait()
+        return self
+
+    def in_runtime_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+        """Run ``coro`` on the runtime loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, fn: Callable[..., Any], *args: Any) -> None:
+        self.loop.call_soon_threadsafe(fn, *args)
+
+
+_runtime: Optional[Runtime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> Runtime:
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = Runtime().start()
+        return _runtime
@@ -1,55 +1,68 @@
-import asyncio
-from joycon import JoyCon
+import struct
+import time
+from capture import get_capture
+from player import Player
+from metrics import get_controller_metrics, metrics_enabled
+from output import get_output
+from report_decoder import ACCEL_SCALE, GYRO_SCALE, REPORT_MOTION_LENGTH, decode_report
 
 # from mouse_simulator import *
 
 # Button masks
 
+_AXES = struct.Struct("<3h")  # three signed 16-bit little endian axes
+
 def decode_gyro(data: bytes):
-    if len(data) < 0x3C:
+    if len(data) < REPORT_MOTION_LENGTH:
         return None
+    gyro_x_raw, gyro_y_raw, gyro_z_raw = _AXES.unpack_from(data, 0x36)
+    return gyro_x_raw * GYRO_SCALE, gyro_y_raw * GYRO_SCALE, gyro_z_raw * GYRO_SCALE
 
-    def to_signed_16(b1, b2):
-        return int.from_bytes(bytes([b1, b2]), byteorder='little', signed=True)
-
-    gyro_x_raw = to_signed_16(data[0x36], data[0x37])
-    gyro_y_raw = to_signed_16(data[0x38], data[0x39])
-    gyro_z_raw = to_signed_16(data[0x3A], data[0x3B])
-
-    scale = 360 / 48000
-
-    gyro_x = gyro_x_raw * scale
-    gyro_y = gyro_y_raw * scale
-    gyro_z = gyro_z_raw * scale
-
-    return gyro_x, gyro_y, gyro_z
 
 def decode_accel(data: bytes):
     if len(data) < 0x36:  # accel bytes end at 0x35 (0x30..0x35)
         return None
+    accel_x_raw, accel_y_raw, accel_z_raw = _AXES.unpack_from(data, 0x30)
+    return accel_x_raw * ACCEL_SCALE, accel_y_raw * ACCEL_SCALE, accel_z_raw * ACCEL_SCALE
 
-    def to_signed_16(b1, b2):
-        return int.from_bytes(bytes([b1, b2]), byteorder='little', signed=True)
-
-    accel_x_raw = to_signed_16(data[0x30], data[0x31])
-    accel_y_raw = to_signed_16(data[0x32], data[0x33])
-    accel_z_raw = to_signed_16(data[0x34], data[0x35])
-
-    scale = 1 / 4096  # 4096 = 1G
-
-    accel_x = accel_x_raw * scale
-    accel_y = accel_y_raw * scale
-    accel_z = accel_z_raw * scale
-
-    return accel_x, accel_y, accel_z
 # BC CB 00 00 10 00 00 E0 FF 0F FF F7 7F DD 07 7E A4 00 74 01 77 11 77 0C 00 00 00 00 00 00 00 4D 0E 00 00 00 00 00 00 00 00 01 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00
 # SR
 
 
-async def handle_single_notification(sender, data, is_left, gamepad: JoyCon, upright):
-    if gamepad:
-        # Buttons -> keyboard
-        gamepad.process_buttons(data)
-        # Sticks -> keyboard (and optional deltas for mouse)
-        move_x, move_y = gamepad.process_sticks(data)
-        # If you want to move the cursor using a sensor, do it elsewhere. For safety, we don't move mouse here continuously.
\ No newline at end of file
+def make_notification_handler(player: Player, upright, address: str | None = None):
+    # Plain function so bleak calls it directly instead of scheduling a task per packet.
+    # The gamepad is looked up per call because it is attached after the type window.
+    capture = get_capture()
+    metrics = get_controller_metrics(address or f"player{player.number}") if metrics_enabled() else None
+    if capture is None and metrics is None:
+        def on_notify(sender, data):
+            gamepad = player.gamepad
+            if gamepad is not None:
+                gamepad.process_report(data)
+        return on_notify
+
+    clock = time.perf_counter_ns
+    output = get_output()
+
+    def on_notify_instrumented(sender, data):
+        t_notify = clock()
+        if capture is not None:
+            capture.record(player.side, data)
+        gamepad = player.gamepad
+        if gamepad is None:
+            return
+        if metrics is None:
+            gamepad.process_report(data)
+            return
+        if not gamepad.link.accept(data):
+            return
+        frame = decode_report(data, gamepad.frame)
+        t_decoded = clock()
+        # Events queued while mapping carry the notify time to the output worker
+        output.tag = (metrics, t_notify)
+        try:
+            gamepad.map_frame(frame)
+        finally:
+            output.tag = None
+        metrics.record(t_notify, t_decoded, clock())
+    return on_notify_instrumented
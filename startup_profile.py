@@ -0,0 +1,45 @@
+"""Phase timings for ``python main.py --profile-startup``.
+
+Each ``profiler.phase(name)`` block is timed from the moment this module was
+imported (the first thing main.py does), and ``report`` prints the table once
+a milestone such as "tray icon ready" is reached. Without the flag every call
+is a no-op.
+"""
+from __future__ import annotations
+
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+
+class StartupProfiler:
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.t0 = time.perf_counter()
+        # (name, started at, duration), seconds relative to t0
+        self.phases: List[Tuple[str, float, float]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start - self.t0, time.perf_counter() - start))
+
+    def report(self, milestone: str) -> None:
+        if not self.enabled:
+            return
+        total = time.perf_counter() - self.t0
+        print(f"\n⏱️ Startup profile: {milestone} after {total * 1000:.1f} ms")
+        for name, started, took in self.phases:
+            print(f"  {name:<28} {took * 1000:8.1f} ms   (at {started * 1000:7.1f} ms)")
+        accounted = sum(took for _, _, took in self.phases)
+        print(f"  {'other':<28} {(total - accounted) * 1000:8.1f} ms")
+
+
+profiler = StartupProfiler("--profile-startup" in sys.argv)
@@ -0,0 +1,86 @@
+"""Per-controller stick calibration: resting center, usable range and deadzone.
+
+Stored per Joy-Con as ``settings["devices"][address]["calibration"]``::
+
+    {"center": [2061, 2030], "range": [1710, 1685], "deadzone": 0.15}
+
+and compiled into the stick quantizer table when the controller connects, so
+a calibrated stick costs exactly the same per report as an uncalibrated one.
+"""
+from __future__ import annotations
+
+import math
+from statistics import median
+from typing import List, Tuple
+
+from stick_quantizer import DEFAULT_CALIBRATION, STICK_DEADZONE, StickCalibration
+
+# Seconds to hold the sticks still, then to roll them around their edge
+CALIBRATION_REST = 1.5
+CALIBRATION_SWEEP = 4.0
+# Fewer samples than this means the controller wasn't sending reports
+MIN_SAMPLES = 10
+# A sweep that doesn't reach this far (raw units) from center wasn't a sweep
+MIN_RANGE = 800
+# Deadzone is widened to this multiple of the resting jitter when that exceeds the default
+NOISE_MARGIN = 1.5
+
+
+class CalibrationError(ValueError):
+    pass
+
+
+class StickCalibrator:
+    """Collects raw samples of one stick: first at rest, then swept around its edge."""
+
+    def __init__(self) -> None:
+        self.resting: List[Tuple[int, int]] = []
+        self.sweep: List[Tuple[int, int]] = []
+        self.sweeping = False
+
+    def sample(self, raw_x: int, raw_y: int) -> None:
+        (self.sweep if self.sweeping else self.resting).append((raw_x, raw_y))
+
+    def result(self) -> StickCalibration:
+        if len(self.resting) < MIN_SAMPLES or len(self.sweep) < MIN_SAMPLES:
+            raise CalibrationError("not enough stick reports; is the controller connected?")
+        center_x = round(median(x for x, _ in self.resting))
+        center_y = round(median(y for _, y in self.resting))
+        xs = [x for x, _ in self.sweep]
+        ys = [y for _, y in self.sweep]
+        # The shorter side of each axis, so full tilt reaches 1.0 in both directions
+        range_x = min(max(xs) - center_x, center_x - min(xs))
+        range_y = min(max(ys) - center_y, center_y - min(ys))
+        if min(range_x, range_y) < MIN_RANGE:
+            raise CalibrationError("the stick wasn't rolled all the way around its edge")
+        jitter = max(math.hypot((x - center_x) / range_x, (y - center_y) / range_y) for x, y in self.resting)
+        deadzone = max(STICK_DEADZONE, round(jitter * NOISE_MARGIN, 3))
+        return StickCalibration(center_x, center_y, float(range_x), float(range_y), deadzone)
+
+
+def parse_calibration(raw: object) -> StickCalibration:
+    """Validate a stored calibration; None means the ideal defaults."""
+    if raw is None:
+        return DEFAULT_CALIBRATION
+    if not isinstance(raw, dict):
+        raise CalibrationError("calibration must be an object")
+    center = raw.get("center")
+    span = raw.get("range")
+    if not (isinstance(center, list) and len(center) == 2
+            and all(isinstance(v, int) and 0 <= v <= 4095 for v in center)):
+        raise CalibrationError(f"center must be two raw values in 0..4095, got {center!r}")
+    if not (isinstance(span, list) and len(span) == 2
+            and all(isinstance(v, (int, float)) and 0 < v <= 4095 for v in span)):
+        raise CalibrationError(f"range must be two positive raw values, got {span!r}")
+    deadzone = raw.get("deadzone", STICK_DEADZONE)
+    if not isinstance(deadzone, (int, float)) or not 0 <= deadzone < 1:
+        raise CalibrationError(f"deadzone must be in 0..1, got {deadzone!r}")
+    return StickCalibration(center[0], center[1], float(span[0]), float(span[1]), float(deadzone))
+
+
+def calibration_setting(calibration: StickCalibration) -> dict:
+    return {
+        "center": [calibration.center_x, calibration.center_y],
+        "range": [calibration.range_x, calibration.range_y],
+        "deadzone": calibration.deadzone,
+    }
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import math
+import sys
+import time
+from functools import lru_cache
+from typing import NamedTuple
+
+# Sector codes: 0=Right, 1=Up-Right, 2=Up, ... 7=Down-Right, plus NEUTRAL inside the deadzone
+NEUTRAL = 8
+SECTOR_COUNT = 9
+# Table cells that straddle a sector or deadzone edge; resolved with the exact math
+_BOUNDARY = 0xFF
+
+STICK_DEADZONE = 0.15
+STICK_CENTER = 2048
+STICK_RANGE = 2048.0
+# Defaults for StickState: degrees past a sector edge, and normalized distance past the deadzone
+STICK_ANGULAR_HYSTERESIS = 4.0
+STICK_RADIAL_HYSTERESIS = 0.03
+
+
+class StickCalibration(NamedTuple):
+    """Where a stick rests and how far it travels, in raw 12-bit units.
+
+    Field order matches the quantizer parameters, so ``get_quantizer(shift, *calibration)``
+    builds the table for a calibrated stick.
+    """
+    center_x: int = STICK_CENTER
+    center_y: int = STICK_CENTER
+    range_x: float = STICK_RANGE
+    range_y: float = STICK_RANGE
+    # Radial, in normalized units
+    deadzone: float = STICK_DEADZONE
+
+    def normalize(self, raw_x: int, raw_y: int) -> tuple[float, float]:
+        return (raw_x - self.center_x) / self.range_x, (raw_y - self.center_y) / self.range_y
+
+
+DEFAULT_CALIBRATION = StickCalibration()
+
+# Direction codes produced by each sector, in the same order as SECTOR_* codes
+SECTOR_DIRECTIONS = (
+    ("R",),
+    ("U", "R"),
+    ("U",),
+    ("U", "L"),
+    ("L",),
+    ("D", "L"),
+    ("D",),
+    ("D", "R"),
+    (),
+)
+
+
+def _angle_sector(x: float, y: float) -> int:
+    # Angle: 0=Right, 90=Up, 180=Left, 270=Down (y negative is up in our stick space)
+    angle = (math.degrees(math.atan2(-y, x)) + 360.0) % 360.0
+    return int((angle + 22.5) // 45) % 8  # 0..7 centered sectors
+
+
+def exact_sector(
+    raw_x: int,
+    raw_y: int,
+    center_x: int = STICK_CENTER,
+    center_y: int = STICK_CENTER,
+    range_x: float = STICK_RANGE,
+    range_y: float = STICK_RANGE,
+    deadzone: float = STICK_DEADZONE,
+) -> int:
+    """Trigonometric 8-way quantization of a raw 12-bit stick sample."""
+    x = (raw_x - center_x) / range_x
+    y = (raw_y - center_y) / range_y
+    if math.hypot(x, y) < deadzone:
+        return NEUTRAL
+    return _angle_sector(x, y)
+
+
+def _axis_extent(lo: float, hi: float) -> tuple[float, float]:
+    # Smallest and largest |v| for v in [lo, hi]
+    if lo <= 0.0 <= hi:
+        return 0.0, max(-lo, hi)
+    return min(abs(lo), abs(hi)), max(abs(lo), abs(hi))
+
+
+class StickQuantizer:
+    """Maps raw 12-bit stick samples to sector codes through a lookup table.
+
+    The raw space is coarsened by ``shift`` bits per axis. Cells that lie
+    entirely inside one sector (or entirely inside the deadzone) resolve with a
+    single table read; the few cells that straddle an edge fall back to
+    ``exact_sector`` so results always match the trigonometric path.
+    """
+
+    __slots__ = ("shift", "row_shift", "table", "params")
+
+    def __init__(
+        self,
+        shift: int = 4,
+        center_x: int = STICK_CENTER,
+        center_y: int = STICK_CENTER,
+        range_x: float = STICK_RANGE,
+        range_y: float = STICK_RANGE,
+        deadzone: float = STICK_DEADZONE,
+    ) -> None:
+        self.shift = shift
+        self.row_shift = 12 - shift
+        self.params = (center_x, center_y, range_x, range_y, deadzone)
+        self.table = self._build()
+
+    def _build(self) -> bytearray:
+        center_x, center_y, range_x, range_y, deadzone = self.params
+        shift = self.shift
+        cells = 1 << (12 - shift)
+        span = (1 << shift) - 1
+        # Normalized [lo, hi] bounds of every cell along each axis
+        xs = [((c << shift) - center_x) / range_x for c in range(cells)]
+        xs = [(lo, lo + span / range_x) for lo in xs]
+        ys = [((c << shift) - center_y) / range_y for c in range(cells)]
+        ys = [(lo, lo + span / range_y) for lo in ys]
+        x_extent = [_axis_extent(lo, hi) for lo, hi in xs]
+        y_extent = [_axis_extent(lo, hi) for lo, hi in ys]
+
+        table = bytearray(cells * cells)
+        i = 0
+        for cy in range(cells):
+            y_lo, y_hi = ys[cy]
+            y_min, y_max = y_extent[cy]
+            for cx in range(cells):
+                x_lo, x_hi = xs[cx]
+                x_min, x_max = x_extent[cx]
+                if math.hypot(x_max, y_max) < deadzone:
+                    table[i] = NEUTRAL
+                elif math.hypot(x_min, y_min) < deadzone:
+                    table[i] = _BOUNDARY
+                else:
+                    # Sectors are convex wedges, so a cell whose four corners
+                    # agree lies entirely inside that sector.
+                    sector = _angle_sector(x_lo, y_lo)
+                    if (
+                        _angle_sector(x_hi, y_lo) == sector
+                        and _angle_sector(x_lo, y_hi) == sector
+                        and _angle_sector(x_hi, y_hi) == sector
+                    ):
+                        table[i] = sector
+                    else:
+                        table[i] = _BOUNDARY
+                i += 1
+        return table
+
+    def sector(self, raw_x: int, raw_y: int) -> int:
+        shift = self.shift
+        code = self.table[((raw_y >> shift) << self.row_shift) | (raw_x >> shift)]
+        if code == _BOUNDARY:
+            return exact_sector(raw_x, raw_y, *self.params)
+        return code
+
+    def boundary_fraction(self) -> float:
+        return self.table.count(_BOUNDARY) / len(self.table)
+
+
+@lru_cache(maxsize=None)
+def get_quantizer(
+    shift: int = 4,
+    center_x: int = STICK_CENTER,
+    center_y: int = STICK_CENTER,
+    range_x: float = STICK_RANGE,
+    range_y: float = STICK_RANGE,
+    deadzone: float = STICK_DEADZONE,
+) -> StickQuantizer:
+    """Shared quantizer per parameter set; tables are read-only once built."""
+    return StickQuantizer(shift, center_x, center_y, range_x, range_y, deadzone)
+
+
+class StickState:
+    """8-way quantization with hysteresis, so a stick resting on an edge doesn't chatter keys.
+
+    Leaving a sector takes ``angular`` degrees past its edge, leaving the
+    deadzone takes ``radial`` past its rim, and with ``min_hold`` (seconds) no
+    direction changes again sooner than that. Samples that agree with the held
+    code cost one table read, same as the bare quantizer.
+    """
+
+    __slots__ = ("quantizer", "angular", "radial", "min_hold", "code", "_raw", "_changed_at", "applied", "suppressed")
+
+    def __init__(self, quantizer: StickQuantizer, angular: float = STICK_ANGULAR_HYSTERESIS,
+                 radial: float = STICK_RADIAL_HYSTERESIS, min_hold: float = 0.0) -> None:
+        self.quantizer = quantizer
+        self.angular = angular
+        self.radial = radial
+        self.min_hold = min_hold
+        # Code currently reported, and what the quantizer said for the last sample
+        self.code = NEUTRAL
+        self._raw = NEUTRAL
+        self._changed_at = 0.0
+        # Direction changes let through, and quantizer flips held back by hysteresis
+        self.applied = 0
+        self.suppressed = 0
+
+    def sector(self, raw_x: int, raw_y: int) -> int:
+        raw = self.quantizer.sector(raw_x, raw_y)
+        code = self.code
+        if raw == code:
+            self._raw = raw
+            return code
+        # Only reached on a flip, so the clock read stays off the steady-state path
+        now = time.perf_counter()
+        if now - self._changed_at >= self.min_hold and self._past_edge(raw_x, raw_y, raw, code):
+            self.code = raw
+            self._changed_at = now
+            self.applied += 1
+        elif raw != self._raw:
+            # Count each flip that was absorbed, not every report spent inside the band
+            self.suppressed += 1
+        self._raw = raw
+        return self.code
+
+    def _past_edge(self, raw_x: int, raw_y: int, raw: int, code: int) -> bool:
+        if raw == NEUTRAL:
+            # The radial band sits outside the deadzone, so dropping into it always releases
+            return True
+        center_x, center_y, range_x, range_y, deadzone = self.quantizer.params
+        x = (raw_x - center_x) / range_x
+        y = (raw_y - center_y) / range_y
+        if code == NEUTRAL:
+            return math.hypot(x, y) >= deadzone + self.radial
+        # Angular distance from the held sector's center; its edge is at 22.5 degrees
+        angle = math.degrees(math.atan2(-y, x))
+        offset = abs((angle - code * 45.0 + 180.0) % 360.0 - 180.0)
+        return offset >= 22.5 + self.angular
+
+    def reset(self) -> None:
+        self.code = self._raw = NEUTRAL
+        self._changed_at = 0.0
+
+    def stats(self) -> dict:
+        return {"applied": self.applied, "suppressed": self.suppressed}
+
+
+def verify(quantizer: StickQuantizer) -> int:
+    """Compare the table against exact_sector over the whole raw input space.
+
+    Returns the number of mismatching samples (should be 0).
+    """
+    params = quantizer.params
+    sector = quantizer.sector
+    mismatches = 0
+    for raw_y in range(4096):
+        for raw_x in range(4096):
+            if sector(raw_x, raw_y) != exact_sector(raw_x, raw_y, *params):
+                mismatches += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python stick_quantizer.py [shift] -- exhaustive equivalence check (takes a while)
+    shift = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    q = get_quantizer(shift)
+    print(f"shift={shift}: {len(q.table)} cells, {q.boundary_fraction():.2%} fall back to exact math")
+    bad = verify(q)
+    print(f"{bad} mismatches over 4096x4096 raw samples")
+    sys.exit(1 if bad else 0)
@@ -0,0 +1,477 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import random
+import time
+from typing import Callable, Optional, Set
+
+from analog_stick import STICK_MODES, AnalogStick, get_stick_scheduler, parse_curve
+from app_state import register_controller, unregister_controller
+from command_channel import command_channel, play_vibration_preset, set_leds
+from haptics import get_haptics
+from macros import MacroError, get_macros, parse_macros
+from mapping import ProfileError, parse_profiles
+from metrics import get_controller_metrics
+from player import Player
+from runtime import Runtime, get_runtime
+from stick_quantizer import STICK_ANGULAR_HYSTERESIS, STICK_RADIAL_HYSTERESIS
+from stick_calibration import CALIBRATION_REST, CALIBRATION_SWEEP, CalibrationError, calibration_setting, parse_calibration
+from user_preferences import settings
+from utils import INPUT_REPORT_UUID, JOYCON_MANUFACTURER_ID, JOYCON_MANUFACTURER_PREFIX
+
+# bleak (and the CoreBluetooth bindings behind it) is imported inside the
+# coroutines that need it, so it loads on the runtime thread after the tray is up
+
+
+# Pairing mode keeps scanning this long for more controllers
+PAIRING_WINDOW = 20.0
+# Single/dual mapping only knows one left and one right Joy-Con
+MAX_CONTROLLERS = 2
+# How long to look for one saved controller before giving up on the direct connect
+KNOWN_DEVICE_TIMEOUT = 5.0
+# Reconnect backoff: first retry right away, then BASE * 2^n seconds capped at MAX,
+# each scaled by a random factor so two controllers don't retry in lockstep
+RECONNECT_BACKOFF_BASE = 0.25
+RECONNECT_BACKOFF_MAX = 8.0
+
+
+def is_joycon2(adv) -> bool:
+    data = adv.manufacturer_data.get(JOYCON_MANUFACTURER_ID)
+    return bool(data and data.startswith(JOYCON_MANUFACTURER_PREFIX))
+
+
+def apply_player_settings(player: Player):
+    if player.gamepad:
+        apply_profiles(player)
+        apply_calibration(player)
+        player.gamepad.set_macros(get_macros())
+        player.gamepad.set_mouse_mode(
+            settings.get("mouse_mode", False),
+            settings.get("mouse_sensitivity", 1.0),
+            settings.get("mouse_output_hz", 125),
+        )
+        player.gamepad.set_gyro_aim(
+            settings.get("gyro_aim", False),
+            settings.get("gyro_sensitivity", 8.0),
+            settings.get("mouse_output_hz", 125),
+        )
+        player.gamepad.set_stick_hysteresis(
+            settings.get("stick_hysteresis", STICK_ANGULAR_HYSTERESIS),
+            settings.get("stick_radial_hysteresis", STICK_RADIAL_HYSTERESIS),
+            settings.get("stick_min_hold", 0.0),
+        )
+        player.gamepad.on_haptic = haptic_trigger(player) if settings.get("haptic_combos", False) else None
+        apply_stick_output(player)
+        if player.address:
+            # A new side gets a new JoyCon, so point the exported counters at its state
+            metrics = get_controller_metrics(player.address)
+            metrics.stick = player.gamepad.stick_state
+            metrics.link = player.gamepad.link
+
+
+def apply_stick_output(player: Player):
+    gamepad = player.gamepad
+    scheduler = get_stick_scheduler()
+    if gamepad.analog is not None:
+        scheduler.remove(gamepad.analog)
+    mode = settings.get("stick_output", "digital")
+    if mode not in STICK_MODES:
+        print(f"⚠️ Unknown stick_output {mode!r}, using digital")
+        mode = "digital"
+    if mode == "digital":
+        gamepad.set_analog(None)
+        return
+    try:
+        curve = parse_curve(settings.get("stick_curve", "quadratic"))
+    except ValueError as e:
+        print(f"⚠️ {e}; using quadratic")
+        curve = "quadratic"
+    scheduler.set_rate(settings.get("stick_output_hz", 125))
+    analog = AnalogStick(
+        mode,
+        curve,
+        speed=settings.get("stick_speed", 1200.0),
+        pwm_period=settings.get("stick_pwm_period", 0.1),
+        stick_id=gamepad.side,
+    )
+    gamepad.set_analog(analog)
+    scheduler.add(analog)
+
+
+def load_macros():
+    engine = get_macros()
+    try:
+        engine.load(parse_macros(settings.get("macros"), engine))
+    except MacroError as e:
+        print(f"⚠️ Ignoring macros: {e}")
+
+
+def apply_profiles(player: Player):
+    device = settings.get("devices", {}).get(player.address) or {}
+    try:
+        profiles = parse_profiles(device.get("profiles"), player.gamepad.side)
+    except ProfileError as e:
+        # Keep whatever mapping is active rather than half-applying a broken profile
+        print(f"⚠️ Ignoring mapping profiles for {player.address}: {e}")
+        return
+    player.gamepad.set_profiles(profiles)
+
+
+def apply_calibration(player: Player):
+    device = settings.get("devices", {}).get(player.address) or {}
+    try:
+        calibration = parse_calibration(device.get("calibration"))
+    except CalibrationError as e:
+        print(f"⚠️ Ignoring stick calibration for {player.address}: {e}")
+        return
+    player.gamepad.set_calibration(calibration)
+
+
+def haptic_trigger(player: Player):
+    engine = get_haptics()
+
+    def trigger(pattern: str) -> None:
+        for client in player.clients:
+            engine.play(client, pattern)
+    return trigger
+
+
+def reconnect_delay(attempt: int) -> float:
+    if attempt == 0:
+        return 0.0
+    delay = min(RECONNECT_BACKOFF_MAX, RECONNECT_BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def handle_single_joycon(client, player: Player, upright: bool):
+    # Build the handler once per client and re-subscribe with it after a reconnect
+    handler = getattr(client, "_notify_handler", None)
+    if handler is None:
+        from solo_logic import make_notification_handler
+        handler = client._notify_handler = make_notification_handler(player, upright, client.address)
+    await client.start_notify(INPUT_REPORT_UUID, handler)
+
+
+class ControllerSupervisor:
+    """Owns every player, its BLE client and its background tasks.
+
+    All state is touched only from the runtime loop. Other threads (tray,
+    Tk) go through ``submit``, which schedules one of the ``cmd_*``
+    coroutines on that loop.
+    """
+
+    def __init__(self, runtime: Runtime, on_new_device: Callable[[str, Player], None]) -> None:
+        self.runtime = runtime
+        # Called when a controller without a saved type connects; must be thread-safe
+        self.on_new_device = on_new_device
+        self.players: list[Player] = []
+        self.used_addresses: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        # Player numbers handed out to controllers that are still connecting
+        self._reserved_numbers: Set[int] = set()
+        self._pairing = False
+        # Macros from settings, loaded on the loop whose timer wheel runs them
+        runtime.call_soon(load_macros)
+
+    def submit(self, command: str, *args) -> concurrent.futures.Future:
+        """Thread-safe: run ``cmd_<command>(*args)`` on the runtime loop."""
+        handler = getattr(self, f"cmd_{command}")
+        return self.runtime.submit(handler(*args))
+
+    def spawn(self, coro) -> asyncio.Task:
+        # Keep a reference so background tasks are not garbage collected mid-flight
+        task = self.runtime.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # Commands
+
+    async def cmd_pair(self, window: float = PAIRING_WINDOW):
+        """Pairing mode: one scanner, every new Joy-Con 2 connected concurrently.
+
+        Scanning stops after ``window`` seconds or once MAX_CONTROLLERS are
+        connected or connecting. Returns the numbers of the paired players.
+        """
+        if self._pairing:
+            print("🔍 Already searching for controllers")
+            return []
+        if len(self.players) >= MAX_CONTROLLERS:
+            print(f"🎮 Already {len(self.players)} controllers connected")
+            return []
+        self._pairing = True
+        # Saved controllers connect directly; the scan below only has to find new ones
+        pending = self._connect_known()
+        loop = asyncio.get_running_loop()
+        found: asyncio.Queue = asyncio.Queue()
+        seen: Set[str] = set()
+
+        def callback(device, adv):
+            if device.address in self.used_addresses or device.address in seen:
+                return
+            if is_joycon2(adv):
+                seen.add(device.address)
+                print(f"  Found {device.name or 'Unknown'} ({device.address})")
+                found.put_nowait(device)
+
+        scanner = None
+        deadline = loop.time() + window
+        try:
+            while (remaining := deadline - loop.time()) > 0:
+                if len(self.players) + len(self._reserved_numbers) >= MAX_CONTROLLERS:
+                    # Every slot is taken or being connected; a saved controller that
+                    # turns out to be out of range frees its slot again
+                    connecting = [task for task in pending if not task.done()]
+                    if not connecting:
+                        break
+                    await asyncio.wait(connecting, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                if scanner is None:
+                    from bleak import BleakScanner
+                    print("\n🔍 Searching for Joy-Cons (press sync on each one)...")
+                    scanner = BleakScanner(callback)
+                    await scanner.start()
+                try:
+                    device = await asyncio.wait_for(found.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self.used_addresses.add(device.address)
+                pending.append(self.spawn(self.setup_player(device, self._reserve_number())))
+        finally:
+            if scanner is not None:
+                await scanner.stop()
+            self._pairing = False
+
+        if not pending:
+            print("❌ No device found.")
+            return []
+        return await self._gather_players(pending)
+
+    async def cmd_connect_known(self):
+        """Connect every saved controller that is in range, without a pairing scan."""
+        return await self._gather_players(self._connect_known())
+
+    def _connect_known(self) -> list[asyncio.Task]:
+        # One direct connect per saved address, all in parallel
+        pending = []
+        for address in settings.get("devices", {}):
+            if len(self.players) + len(self._reserved_numbers) >= MAX_CONTROLLERS:
+                break
+            if address in self.used_addresses:
+                continue
+            self.used_addresses.add(address)
+            pending.append(self.spawn(self.setup_known(address, self._reserve_number())))
+        return pending
+
+    @staticmethod
+    async def _gather_players(pending: list[asyncio.Task]) -> list[int]:
+        results = await asyncio.gather(*pending, return_exceptions=True)
+        return [player.number for player in results if isinstance(player, Player)]
+
+    def _reserve_number(self) -> int:
+        taken = {player.number for player in self.players} | self._reserved_numbers
+        number = 1
+        while number in taken:
+            number += 1
+        self._reserved_numbers.add(number)
+        return number
+
+    async def cmd_remove_player(self, player: Player):
+        if player in self.players:
+            self.players.remove(player)
+        # Stop the reconnect loop first so the disconnect below isn't treated as a drop
+        if player.task is not None:
+            player.task.cancel()
+        for client in player.clients:
+            self.used_addresses.discard(client.address)
+        await player.disconnect()
+
+    async def cmd_emit_sound(self):
+        engine = get_haptics()
+        for player in self.players:
+            for client in player.clients:
+                engine.play(client, "pulse")
+
+    async def cmd_calibrate(self, rest: float = CALIBRATION_REST, sweep: float = CALIBRATION_SWEEP):
+        """Sample every connected stick at rest, then swept around its edge, and save the result."""
+        players = [p for p in self.players if p.gamepad is not None and p.address is not None]
+        if not players:
+            print("⚠️ No controllers to calibrate")
+            return
+        haptics = get_haptics()
+        calibrators = [(player, player.gamepad.begin_calibration()) for player in players]
+        try:
+            print(f"🎯 Calibrating: leave the sticks centered for {rest:g}s...")
+            await asyncio.sleep(rest)
+            for player, calibrator in calibrators:
+                calibrator.sweeping = True
+                for client in player.clients:
+                    haptics.play(client, "pulse")
+            print(f"🎯 Now roll each stick slowly around its edge for {sweep:g}s...")
+            await asyncio.sleep(sweep)
+        finally:
+            for player, _ in calibrators:
+                player.gamepad.end_calibration()
+        for player, calibrator in calibrators:
+            try:
+                calibration = calibrator.result()
+            except CalibrationError as e:
+                print(f"⚠️ Calibration failed for {player.address}: {e}")
+                continue
+            print(f"✅ Calibrated {player.address}: center {calibration.center_x},{calibration.center_y}, "
+                  f"range {calibration.range_x:.0f},{calibration.range_y:.0f}, deadzone {calibration.deadzone:.2f}")
+            settings.setdefault("devices", {}).setdefault(player.address, {})["calibration"] = calibration_setting(calibration)
+            player.gamepad.set_calibration(calibration)
+            for client in player.clients:
+                haptics.play(client, "double_pulse")
+        settings.save()
+
+    async def cmd_attach_side(self, player: Player, side: str):
+        player.attach_joycon(side)
+        apply_player_settings(player)
+
+    async def cmd_apply_settings(self):
+        load_macros()
+        for player in self.players:
+            apply_player_settings(player)
+
+    async def cmd_probe_bluetooth(self):
+        """Short BLE scan to trigger the system Bluetooth permission prompt early."""
+        scanner = None
+        try:
+            from bleak import BleakScanner
+            scanner = BleakScanner()
+            await scanner.start()
+            await asyncio.sleep(1.0)
+        except Exception:
+            pass
+        finally:
+            try:
+                if scanner is not None:
+                    await scanner.stop()
+            except Exception:
+                pass
+
+    # Connection management
+
+    async def connect_and_setup(self, device, player: Player, handler_func, *handler_args):
+        from bleak import BleakClient
+        # Set by bleak's disconnect callback; maintain_connection_loop waits on it
+        disconnected = asyncio.Event()
+        client = BleakClient(device, disconnected_callback=lambda _: disconnected.set())
+        await client.connect()
+        client._device = device
+        client._disconnected = disconnected
+        registered = None
+        try:
+            command_channel(client, settings.get("command_write_hz"))
+            # Writes with response return once the controller acknowledged them, which
+            # replaces the fixed settle delays between connect, LEDs and vibration
+            await set_leds(client, player.number, response=True)
+            await play_vibration_preset(client, 0x04, response=True)  # Play default vibration preset
+            if device.address not in settings["devices"]:
+                self.on_new_device(device.address, player)
+            else:
+                player.attach_joycon(settings["devices"][device.address]["type"])
+                apply_player_settings(player)
+            # Track connected side for single/dual logic
+            if player.side:
+                registered = player.side
+                register_controller(registered)
+            await handler_func(client, player, *handler_args)
+        except BaseException:
+            # Don't leave a connected client behind that nothing references
+            channel = getattr(client, "_commands", None)
+            if channel is not None:
+                channel.close()
+            if registered:
+                unregister_controller(registered)
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+            raise
+        player.clients.append(client)
+        print(f"✅ Connected to {device.address}")
+        return client
+
+    async def maintain_connection_loop(self, client, device, player, handler_func, *handler_args):
+        """Sleep until bleak reports a disconnect, then reconnect with jittered backoff.
+
+        The client keeps the BLEDevice it was created with, so reconnecting
+        skips discovery, and the notification handler is reused.
+        """
+        metrics = get_controller_metrics(device.address)
+        disconnected: asyncio.Event = client._disconnected
+        while True:
+            await disconnected.wait()
+            lost_at = time.perf_counter_ns()
+            print(f"⚠️ Lost connection to {device.address}")
+            # Mark this side as currently unavailable for single/dual mapping
+            if player.side:
+                unregister_controller(player.side)
+            if player.gamepad is not None:
+                # The controller may restart its packet, mouse and IMU counters on reconnect
+                player.gamepad.reset_link()
+            attempt = 0
+            while True:
+                await asyncio.sleep(reconnect_delay(attempt))
+                attempt += 1
+                disconnected.clear()
+                try:
+                    await client.connect()
+                    await handler_func(client, player, *handler_args)
+                    break
+                except Exception as e:
+                    print(f"⚠️ Reconnect to {device.address} failed (attempt {attempt}): {e}")
+                    if client.is_connected:
+                        try:
+                            await client.disconnect()
+                        except Exception:
+                            pass
+            if player.side:
+                register_controller(player.side)
+            metrics.record_reconnect(time.perf_counter_ns() - lost_at)
+            print(f"🔄 Reconnected to {device.address} after {attempt} attempt(s)")
+
+    async def setup_known(self, address: str, number: int) -> Optional[Player]:
+        # Targeted lookup returns as soon as this address advertises, no full scan window
+        from bleak import BleakScanner
+        try:
+            device = await BleakScanner.find_device_by_address(address, timeout=KNOWN_DEVICE_TIMEOUT)
+        except Exception:
+            device = None
+        if device is None:
+            print(f"💤 Saved Joy-Con {address} not in range")
+            self._reserved_numbers.discard(number)
+            self.used_addresses.discard(address)
+            return None
+        return await self.setup_player(device, number)
+
+    async def setup_player(self, device, number) -> Optional[Player]:
+        print(f"\n🎮 Setting up Player {number} ({device.address})")
+        upright = "U"
+        player = Player(number, "SINGLE_JOYCON", address=device.address)
+        try:
+            client = await self.connect_and_setup(device, player, handle_single_joycon, upright)
+        except Exception as e:
+            print(f"❌ Setup of {device.address} failed: {e}")
+            self.used_addresses.discard(device.address)
+            return None
+        finally:
+            self._reserved_numbers.discard(number)
+        player.task = self.spawn(self.maintain_connection_loop(client, device, player, handle_single_joycon, upright))
+        self.players.append(player)
+        return player
+
+
+_supervisor: Optional[ControllerSupervisor] = None
+
+
+def get_supervisor(on_new_device: Optional[Callable[[str, Player], None]] = None) -> ControllerSupervisor:
+    """Process-wide supervisor on the shared runtime; the first caller sets ``on_new_device``."""
+    global _supervisor
+    if _supervisor is None:
+        _supervisor = ControllerSupervisor(get_runtime(), on_new_device or (lambda address, player: None))
+    return _supervisor
@@ -0,0 +1,119 @@
+"""Hashed timer wheel for macro timing (turbo, tap/hold, sequences).
+
+Timers are hashed by their expiry tick into one of ``slots`` buckets. Each
+tick only visits the bucket for that tick, so the cost of a tick depends on
+how many timers fall due around then, not on how many are pending overall.
+
+The wheel itself is clock-agnostic: ``advance(now)`` runs everything due up
+to ``now``. ``attach(loop)`` drives it from the asyncio loop with a single
+``call_at`` handle that is only armed while timers are pending.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+from typing import Any, Callable, List, Optional
+
+DEFAULT_TICK = 0.005
+DEFAULT_SLOTS = 512
+
+
+class Timer:
+    __slots__ = ("wheel", "expires", "callback", "args", "done")
+
+    def __init__(self, wheel: "TimerWheel", expires: int, callback: Callable[..., Any], args: tuple) -> None:
+        self.wheel = wheel
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        # Fired or cancelled; either way it no longer counts as pending
+        self.done = False
+
+    def cancel(self) -> None:
+        if not self.done:
+            self.done = True
+            self.wheel.pending -= 1
+
+
+class TimerWheel:
+    def __init__(self, tick: float = DEFAULT_TICK, slots: int = DEFAULT_SLOTS, now: float = 0.0) -> None:
+        self.tick = tick
+        self.slots = slots
+        self._buckets: List[List[Timer]] = [[] for _ in range(slots)]
+        # Last tick that has been processed
+        self._current = int(now / tick)
+        self.pending = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self.fired = 0
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> "TimerWheel":
+        """Drive the wheel from ``loop``; schedule() must then be called on that loop."""
+        self._loop = loop
+        self._current = int(loop.time() / self.tick)
+        return self
+
+    def now(self) -> float:
+        return self._loop.time() if self._loop is not None else self._current * self.tick
+
+    def schedule(self, delay: float, callback: Callable[..., Any], *args: Any) -> Timer:
+        """Run ``callback(*args)`` after ``delay`` seconds, rounded up to the next tick."""
+        if self._loop is not None and self._handle is None:
+            # Idle wheel: catch the tick counter up before hashing a new timer
+            self._current = int(self._loop.time() / self.tick)
+        # Round the deadline up to a tick boundary so a timer never fires early
+        expires = max(self._current + 1, math.ceil((self.now() + delay) / self.tick - 1e-6))
+        timer = Timer(self, expires, callback, args)
+        self._buckets[timer.expires % self.slots].append(timer)
+        self.pending += 1
+        if self._loop is not None and self._handle is None:
+            self._arm()
+        return timer
+
+    def advance(self, now: float) -> int:
+        """Process every tick up to ``now``; returns the number of timers fired."""
+        # The epsilon keeps a loop callback that lands a hair early from missing its tick
+        target = int(now / self.tick + 1e-6)
+        fired = 0
+        while self._current < target and self.pending:
+            self._current += 1
+            fired += self._run_bucket(self._current)
+        if self._current < target:
+            self._current = target
+        return fired
+
+    def _run_bucket(self, tick: int) -> int:
+        bucket = self._buckets[tick % self.slots]
+        if not bucket:
+            return 0
+        due = []
+        keep = []
+        for timer in bucket:
+            if timer.done:
+                continue  # cancelled, just drop it
+            if timer.expires <= tick:
+                due.append(timer)
+            else:
+                # Hashed here but due on a later lap of the wheel
+                keep.append(timer)
+        self._buckets[tick % self.slots] = keep
+        fired = 0
+        for timer in due:
+            # An earlier callback in this batch may have cancelled it
+            if not timer.done:
+                timer.done = True
+                self.pending -= 1
+                timer.callback(*timer.args)
+                fired += 1
+        self.fired += fired
+        return fired
+
+    def _arm(self) -> None:
+        self._handle = self._loop.call_at((self._current + 1) * self.tick, self._on_tick)
+
+    def _on_tick(self) -> None:
+        # _handle stays set while callbacks run, so timers they schedule don't re-arm
+        self.advance(self._loop.time())
+        self._handle = None
+        if self.pending:
+            self._arm()
@@ -1,45 +1,203 @@
 import json
+import os
+import threading
+import time
+from collections.abc import MutableMapping
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable, List, Optional, Set
 from appdirs import user_data_dir
 
 APP_NAME = "joycon2mouse"
 APP_AUTHOR = "moutella"  # Optional, used on Windows
 
+# Writes are coalesced: a burst of toggles ends up as one write this long after the last one
+SAVE_DEBOUNCE = 0.5
 
+DEFAULT_SETTINGS = {
+    "ignore_opening_window": False,
+    "start_with_sync": False,
+    "devices": {},
+    "onboarding_complete": False
+}
+
+
+@lru_cache(maxsize=None)
 def get_settings_path():
     settings_dir = Path(user_data_dir(APP_NAME, APP_AUTHOR))
     settings_dir.mkdir(parents=True, exist_ok=True)
     return settings_dir / "settings.json"
 
 
+def _write_atomic(path: Path, text: str) -> None:
+    # Write next to the target and rename over it, so a crash never leaves half a file
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SettingsStore(MutableMapping):
+    """The process-wide settings, read from disk once on first access.
+
+    Mutate it like a dict, then call ``save()`` (or ``save_settings``) to
+    notify listeners and schedule a debounced write on a background thread.
+    """
+
+    def __init__(self) -> None:
+        self._data: Optional[dict] = None
+        self._lock = threading.Lock()
+        # Serialises file writes without holding _lock (and so the UI thread) during disk I/O
+        self._write_lock = threading.Lock()
+        # Last state listeners were told about, to work out which keys changed
+        self._saved: dict = {}
+        self._listeners: List[Callable[[Set[str]], None]] = []
+        self._pending: Optional[str] = None
+        self._timer: Optional[threading.Timer] = None
+        # mtime of the file as we last read or wrote it; anything else is an outside edit
+        self._mtime: Optional[int] = None
+
+    def _load(self) -> dict:
+        with self._lock:
+            if self._data is None:
+                settings_file = get_settings_path()
+                data = None
+                if settings_file.exists():
+                    try:
+                        with open(settings_file, "r") as f:
+                            data = json.load(f)
+                    except ValueError as e:
+                        # Keep the user's file (likely one typo in a hand edit) instead of losing it
+                        backup = settings_file.with_name(settings_file.name + ".bak")
+                        os.replace(settings_file, backup)
+                        print(f"⚠️ {settings_file} is not valid JSON ({e}); moved it to {backup} and using defaults")
+                if data is None:
+                    data = json.loads(json.dumps(DEFAULT_SETTINGS))
+                    _write_atomic(settings_file, json.dumps(data, indent=2))
+                self._saved = json.loads(json.dumps(data))
+                self._data = data
+                self._mtime = settings_file.stat().st_mtime_ns
+            return self._data
+
+    def __getitem__(self, key):
+        return (self._data if self._data is not None else self._load())[key]
+
+    def __setitem__(self, key, value) -> None:
+        (self._data if self._data is not None else self._load())[key] = value
+
+    def __delitem__(self, key) -> None:
+        del (self._data if self._data is not None else self._load())[key]
+
+    def __iter__(self):
+        return iter(self._data if self._data is not None else self._load())
+
+    def __len__(self) -> int:
+        return len(self._data if self._data is not None else self._load())
+
+    def __repr__(self) -> str:
+        return repr(self._load())
+
+    def subscribe(self, listener: Callable[[Set[str]], None]) -> None:
+        """Call ``listener(changed_keys)`` after every save that changed something."""
+        self._listeners.append(listener)
+
+    def save(self) -> None:
+        data = self._load()
+        # Snapshot on the caller's thread; the writer thread never touches the live dict
+        snapshot = json.dumps(data, indent=2)
+        current = json.loads(snapshot)
+        with self._lock:
+            previous = self._saved
+            self._saved = current
+            self._pending = snapshot
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(SAVE_DEBOUNCE, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+        self._notify(previous, current)
+
+    def _notify(self, previous: dict, current: dict) -> None:
+        changed = {key for key in previous.keys() | current.keys() if previous.get(key) != current.get(key)}
+        if changed:
+            for listener in list(self._listeners):
+                listener(changed)
+
+    def flush(self) -> None:
+        """Write any pending change now. Call before a hard exit."""
+        with self._write_lock:
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if snapshot is not None:
+                path = get_settings_path()
+                _write_atomic(path, snapshot)
+                self._mtime = path.stat().st_mtime_ns
+
+    def reload(self) -> None:
+        """Re-read the file after an outside edit and notify listeners of what changed."""
+        path = get_settings_path()
+        mtime = None
+        try:
+            mtime = path.stat().st_mtime_ns
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not reload {path}: {e}")
+            # Wait for the next edit rather than retrying a half-saved file every poll
+            self._mtime = mtime
+            return
+        self._load()
+        with self._lock:
+            self._mtime = mtime
+            if self._pending is not None:
+                # A change made in the app is about to be written and wins over the edit
+                print(f"⚠️ {path} changed while a save was pending; keeping the app's settings")
+                return
+            previous = self._saved
+            self._data = data
+            self._saved = json.loads(json.dumps(data))
+        print(f"🔁 Reloaded {path}")
+        self._notify(previous, self._saved)
+
+    def start_watching(self, interval: float = 1.0) -> threading.Thread:
+        """Poll the settings file from a daemon thread and reload it when edited."""
+        thread = threading.Thread(target=self._watch, args=(interval,), name="settings-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def _watch(self, interval: float) -> None:
+        path = get_settings_path()
+        while True:
+            time.sleep(interval)
+            try:
+                mtime = path.stat().st_mtime_ns
+            except OSError:
+                continue
+            if mtime != self._mtime:
+                self.reload()
+
+
+settings = SettingsStore()
+
+
 def load_settings():
-    settings_file = get_settings_path()
-    if settings_file.exists():
-        with open(settings_file, "r") as f:
-            return json.load(f)
-    create_default_settings()
-    return load_settings()
-    
-
-def save_settings(settings):
-    settings_file = get_settings_path()
-    with open(settings_file, "w") as f:
-        json.dump(settings, f, indent=2)
-
-
-def create_default_settings():
-    settings_file = get_settings_path()
-    print(get_settings_path())
-    with open(settings_file, "w") as f:
-        settings = {
-            "ignore_opening_window": False,
-            "start_with_sync": False,
-            "devices": {},
-            "onboarding_complete": False
-        }
-        json.dump(settings, f, indent=2)
+    # Kept for callers of the old API: the file is only read once per process
+    return settings
+
+
+def save_settings(_settings=None):
+    # The argument is ignored: there is only one store
+    settings.save()
+
+
+def flush_settings():
+    settings.flush()
+
 
 if __name__ == "__main__":
-    print(load_settings())
-else:
-    settings = load_settings()
\ No newline at end of file
+    print(dict(load_settings()))
@@ -1,4 +1,5 @@
 
+import math
 import sys
 from os import path
 from typing import Literal
@@ -6,10 +7,10 @@ from pathlib import Path
 import traceback
 import tkinter as tk
 from tkinter import messagebox
-from pynput.mouse import Controller as MouseController
-from pynput.keyboard import Controller as KeyboardController
-from pynput.keyboard import Key
 import platform
+import time
+
+from stick_quantizer import DEFAULT_CALIBRATION, StickCalibration
 
 # Constants
 JOYCON_MANUFACTURER_ID = 1363
@@ -28,16 +29,15 @@ SUBCOMMAND_SET_PLAYER_LEDS = 0x07
 SUBCOMMAND_PLAY_VIBRATION_PRESET = 0x02
 
 
-def decode_joystick(data):
+def decode_joystick(data, calibration: StickCalibration = DEFAULT_CALIBRATION):
     try:
         if len(data) != 3:
             return 0, 0
         x = ((data[1] & 0x0F) << 8) | data[0]
         y = (data[2] << 4) | ((data[1] & 0xF0) >> 4)
-        x = (x - 2048) / 2048.0
-        y = (y - 2048) / 2048.0
-        deadzone = 0.08
-        if abs(x) < deadzone and abs(y) < deadzone:
+        x, y = calibration.normalize(x, y)
+        # Same radial deadzone as the key mapping, so both agree on when the stick is centered
+        if math.hypot(x, y) < calibration.deadzone:
             return 0, 0
         x = max(-1.0, min(1.0, x * 1.7))
         y = max(-1.0, min(1.0, y * 1.7))
@@ -56,29 +56,61 @@ def resource_path(relative_path):
         return relative_path
 
 
-# Global controllers (requires Accessibility permission on macOS)
-mouse_controller = MouseController()
-keyboard_controller = KeyboardController()
+# Global controllers (requires Accessibility permission on macOS), created on first use
+# so importing utils stays cheap and the permission check waits until input is sent
+_mouse_controller = None
+_keyboard_controller = None
+
+
+def get_mouse_controller():
+    global _mouse_controller
+    if _mouse_controller is None:
+        from pynput.mouse import Controller as MouseController
+        _mouse_controller = MouseController()
+    return _mouse_controller
+
+
+def get_keyboard_controller():
+    global _keyboard_controller
+    if _keyboard_controller is None:
+        from pynput.keyboard import Controller as KeyboardController
+        _keyboard_controller = KeyboardController()
+    return _keyboard_controller
+
+
+# Last cursor position we set. Relative moves are applied to this instead of
+# reading the position back from the OS on every move; it is re-read at most
+# every CURSOR_RESYNC_INTERVAL seconds to pick up trackpad moves and screen-edge clamping.
+CURSOR_RESYNC_INTERVAL = 0.1
+_cursor_position: tuple[float, float] | None = None
+_cursor_synced_at = 0.0
 
 
 def send_mouse_move(dx: int, dy: int) -> None:
+    global _cursor_position, _cursor_synced_at
     try:
-        x, y = mouse_controller.position
-        mouse_controller.position = (x + dx, y + dy)
+        mouse_controller = _mouse_controller or get_mouse_controller()
+        now = time.monotonic()
+        if _cursor_position is None or now - _cursor_synced_at > CURSOR_RESYNC_INTERVAL:
+            _cursor_position = mouse_controller.position
+            _cursor_synced_at = now
+        x, y = _cursor_position
+        _cursor_position = (x + dx, y + dy)
+        mouse_controller.position = _cursor_position
     except Exception:
-        pass
+        _cursor_position = None
 
 
 def send_key_press(k: object) -> None:
     try:
-        keyboard_controller.press(k)
+        (_keyboard_controller or get_keyboard_controller()).press(k)
     except Exception:
         pass
 
 
 def send_key_release(k: object) -> None:
     try:
-        keyboard_controller.release(k)
+        (_keyboard_controller or get_keyboard_controller()).release(k)
     except Exception:
         pass
 